@@ -4,19 +4,23 @@ from __future__ import annotations
 
 __version__ = "4.0.1"
 
+import asyncio
 import collections
 import logging
-import time
+from functools import partial
+from typing import Any, Callable
 
 import homeassistant.core as ha_core
 from homeassistant.components import websocket_api
 from homeassistant.const import CONF_ENTITY_ID, CONF_OFFSET, CONF_REPEAT
 from homeassistant.core import callback
 from homeassistant.exceptions import HomeAssistantError
+from spotipy import SpotifyException
 
 from .const import (
     CONF_ACCOUNTS,
     CONF_DEVICE_NAME,
+    CONF_DEVICE_WAIT_TIMEOUT,
     CONF_FORCE_PLAYBACK,
     CONF_IGNORE_FULLY_PLAYED,
     CONF_RANDOM,
@@ -38,12 +42,17 @@ from .const import (
     CONF_SPOTIFY_TRACK_NAME,
     CONF_SPOTIFY_URI,
     CONF_START_VOL,
+    CONF_TOKEN_REFRESH_MARGIN,
+    CONF_TRUST_CAST_DEVICE_ID,
     DOMAIN,
     SCHEMA_PLAYLISTS,
+    SCHEMA_WS_PLAYLISTS_SUBSCRIBE,
     SCHEMA_WS_ACCOUNTS,
     SCHEMA_WS_CASTDEVICES,
     SCHEMA_WS_DEVICES,
     SCHEMA_WS_PLAYER,
+    SCHEMA_WS_PLAYER_SUBSCRIBE,
+    SCHEMA_WS_STATS,
     CONF_START_POSITION,
     SERVICE_START_COMMAND_SCHEMA,
     SPOTCAST_CONFIG_SCHEMA,
@@ -51,13 +60,16 @@ from .const import (
     WS_TYPE_SPOTCAST_CASTDEVICES,
     WS_TYPE_SPOTCAST_DEVICES,
     WS_TYPE_SPOTCAST_PLAYER,
+    WS_TYPE_SPOTCAST_PLAYER_SUBSCRIBE,
     WS_TYPE_SPOTCAST_PLAYLISTS,
+    WS_TYPE_SPOTCAST_PLAYLISTS_SUBSCRIBE,
+    WS_TYPE_SPOTCAST_STATS,
 )
 from .helpers import (
-    add_tracks_to_queue,
+    async_add_tracks_to_queue,
+    async_apply_playback_settings,
     async_wrap,
     get_cast_devices,
-    get_random_playlist_from_category,
     get_search_results,
     get_spotify_devices,
     get_spotify_install_status,
@@ -66,6 +78,7 @@ from .helpers import (
     is_valid_uri,
     url_to_spotify_uri,
 )
+from .scheduler import PRIORITY_BACKGROUND
 from .spotcast_controller import SpotcastController
 
 CONFIG_SCHEMA = SPOTCAST_CONFIG_SCHEMA
@@ -74,7 +87,9 @@ DEBUG = True
 _LOGGER = logging.getLogger(__name__)
 
 
-def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
+async def async_setup(
+    hass: ha_core.HomeAssistant, config: collections.OrderedDict
+) -> bool:
     """setup method for integration with Home Assistant
 
     Args:
@@ -103,35 +118,106 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
     sp_key = conf[CONF_SP_KEY]
     accounts = conf.get(CONF_ACCOUNTS)
 
-    spotcast_controller = SpotcastController(hass, sp_dc, sp_key, accounts)
+    spotcast_controller = SpotcastController(
+        hass,
+        sp_dc,
+        sp_key,
+        accounts,
+        token_refresh_margin=conf[CONF_TOKEN_REFRESH_MARGIN],
+        device_wait_timeout=conf[CONF_DEVICE_WAIT_TIMEOUT],
+        trust_cast_device_id=conf[CONF_TRUST_CAST_DEVICE_ID],
+    )
 
     if DOMAIN not in hass.data:
         hass.data[DOMAIN] = {}
     hass.data[DOMAIN]["controller"] = spotcast_controller
 
+    # reuse the tokens of the previous run and keep them refreshed in
+    # the background
+    hass.async_create_task(spotcast_controller.async_load_tokens())
+    spotcast_controller.chromecast_pool.async_start()
+    hass.async_create_task(spotcast_controller.artist_index.async_load())
+    spotcast_controller.category_pools.async_start()
+    hass.async_create_task(spotcast_controller.library_index.async_load())
+    spotcast_controller.library_index.async_start()
+
     @callback
     def websocket_handle_playlists(
             hass: ha_core.HomeAssistant,
             connection,
             msg: str
     ):
-        @async_wrap
-        def get_playlist():
+        async def get_playlist():
             """Handle to get playlist"""
             playlist_type = msg.get("playlist_type")
             country_code = msg.get("country_code")
             locale = msg.get("locale", "en")
             limit = msg.get("limit", 10)
             account = msg.get("account", None)
+            force_refresh = msg.get("force_refresh", False)
 
             _LOGGER.debug("websocket_handle_playlists msg: %s", msg)
-            resp = spotcast_controller.get_playlists(
-                account, playlist_type, country_code, locale, limit
+            resp = await spotcast_controller.async_get_playlists(
+                account,
+                playlist_type,
+                country_code,
+                locale,
+                limit,
+                force_refresh=force_refresh,
             )
             connection.send_message(
                 websocket_api.result_message(msg["id"], resp))
 
-        hass.async_add_job(get_playlist())
+        hass.async_create_task(get_playlist())
+
+    @callback
+    def websocket_handle_playlists_subscribe(
+            hass: ha_core.HomeAssistant,
+            connection,
+            msg: str
+    ):
+        """Handle to stream all the pages of playlists, each as an event
+        message, followed by a completion event"""
+        _LOGGER.debug("websocket_handle_playlists_subscribe msg: %s", msg)
+
+        @callback
+        def send_page(offset: int, resp: dict):
+            connection.send_message(
+                websocket_api.event_message(
+                    msg["id"], {"type": "page", "offset": offset, "page": resp}
+                )
+            )
+
+        async def stream_playlists():
+            try:
+                total = await spotcast_controller.async_stream_playlists(
+                    msg.get("account", None),
+                    msg.get("playlist_type"),
+                    msg.get("country_code"),
+                    msg.get("locale", "en"),
+                    msg.get("page_size", 50),
+                    send_page,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.error("Failed to stream playlists: %s", exc)
+                connection.send_message(
+                    websocket_api.event_message(
+                        msg["id"], {"type": "error", "message": str(exc)}
+                    )
+                )
+                return
+
+            connection.send_message(
+                websocket_api.event_message(
+                    msg["id"], {"type": "complete", "total": total}
+                )
+            )
+
+        task = hass.async_create_task(stream_playlists())
+        connection.subscriptions[msg["id"]] = task.cancel
+        connection.send_message(websocket_api.result_message(msg["id"]))
 
     @callback
     def websocket_handle_devices(
@@ -171,6 +257,28 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
 
         hass.async_add_job(get_player())
 
+    @callback
+    def websocket_handle_player_subscribe(
+            hass: ha_core.HomeAssistant,
+            connection,
+            msg: str,
+    ):
+        """Handle to push the changes of the player state. The first
+        event has the whole state"""
+        _LOGGER.debug("websocket_handle_player_subscribe msg: %s", msg)
+        poller = spotcast_controller.get_player_poller(msg.get("account", None))
+
+        @callback
+        def send_changes(changes: dict):
+            connection.send_message(
+                websocket_api.event_message(msg["id"], changes)
+            )
+
+        connection.send_message(websocket_api.result_message(msg["id"]))
+        connection.subscriptions[msg["id"]] = poller.async_subscribe(
+            send_changes
+        )
+
     @callback
     def websocket_handle_accounts(
             hass: ha_core.HomeAssistant,
@@ -204,7 +312,18 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
 
         connection.send_message(websocket_api.result_message(msg["id"], resp))
 
-    def start_casting(call: ha_core.ServiceCall):
+    @callback
+    def websocket_handle_stats(
+            hass: ha_core.HomeAssistant,
+            connection,
+            msg: str,
+    ):
+        """Handle to get request scheduling and cache counters"""
+        _LOGGER.debug("websocket_handle_stats msg: %s", msg)
+        connection.send_message(
+            websocket_api.result_message(msg["id"], spotcast_controller.stats))
+
+    async def async_start_casting(call: ha_core.ServiceCall):
         """service called."""
         uri = call.data.get(CONF_SPOTIFY_URI)
         category = call.data.get(CONF_SPOTIFY_CATEGORY)
@@ -240,7 +359,7 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
                 except KeyError:
                     country = None
 
-            client = spotcast_controller.get_spotify_client(account)
+            client = await spotcast_controller.async_get_spotify_client(account)
 
             # verify the uri provided and clean-up if required
             if not is_empty_str(uri):
@@ -269,11 +388,60 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
                 uri = ":".join(uri)
 
             # first, rely on spotify id given in config otherwise get one
-            if not spotify_device_id:
-                spotify_device_id = spotcast_controller.get_spotify_device_id(
-                    account, spotify_device_id, device_name, entity_id
+            resolve_device = not spotify_device_id
+            if resolve_device:
+                spotify_device_id = (
+                    await spotcast_controller.async_get_spotify_device_id(
+                        account, spotify_device_id, device_name, entity_id
+                    )
+                )
+
+            async def async_request(request: Callable[[str], Any]) -> Any:
+                """Runs a playback request on the device. If spotify
+                doesn't know the device resolved yet, waits for it to
+                appear and runs the request again"""
+                try:
+                    return await hass.async_add_executor_job(
+                        request, spotify_device_id
+                    )
+                except SpotifyException as exc:
+                    if exc.http_status != 404 or not resolve_device:
+                        raise
+
+                    confirm = spotcast_controller.async_confirm_spotify_device
+                    if not await confirm(spotify_device_id):
+                        raise
+
+                return await hass.async_add_executor_job(
+                    request, spotify_device_id
                 )
 
+            async def async_playback(request: Callable[[str], Any]) -> Any:
+                """Runs a playback request on the device. If spotify
+                doesn't know the device anymore, it is resolved again
+                once"""
+                nonlocal spotify_device_id
+
+                try:
+                    return await async_request(request)
+                except SpotifyException as exc:
+                    if exc.http_status != 404 or not resolve_device:
+                        raise
+
+                _LOGGER.debug(
+                    "Device %s not found by spotify, resolving it again",
+                    spotify_device_id,
+                )
+                spotcast_controller.invalidate_spotify_device_id(
+                    account, device_name, entity_id
+                )
+                spotify_device_id = (
+                    await spotcast_controller.async_get_spotify_device_id(
+                        account, None, device_name, entity_id
+                    )
+                )
+                return await async_request(request)
+
             if start_position is not None:
                 start_position *= 1000
 
@@ -299,79 +467,129 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
                 == 0
             ):
                 _LOGGER.debug("Transfering playback")
-                current_playback = client.current_playback()
+                current_playback = await hass.async_add_executor_job(
+                    client.current_playback
+                )
                 if current_playback is not None:
                     _LOGGER.debug("Current_playback from spotify: %s",
                                   current_playback)
                     force_playback = True
                 _LOGGER.debug("Force playback: %s", force_playback)
-                client.transfer_playback(
-                    device_id=spotify_device_id, force_play=force_playback
+                uri = None
+                await async_playback(
+                    lambda device_id: client.transfer_playback(
+                        device_id=device_id, force_play=force_playback
+                    )
                 )
             elif not is_empty_str(category):
-                uri = get_random_playlist_from_category(
-                    client, category, country, limit)
+                category_pools = spotcast_controller.category_pools
+                uri = await category_pools.async_get_random_playlist(
+                    client,
+                    account or "default",
+                    category,
+                    country,
+                    limit,
+                )
 
                 if uri is None:
                     _LOGGER.error("No playlist returned. Stop service call")
                     return None
 
-                spotcast_controller.play(
-                    client,
-                    spotify_device_id,
-                    uri,
-                    random_song,
-                    position,
-                    ignore_fully_played,
-                    start_position,
+                uri = await async_playback(
+                    lambda device_id: spotcast_controller.play(
+                        client,
+                        device_id,
+                        uri,
+                        random_song,
+                        position,
+                        ignore_fully_played,
+                        start_position,
+                    )
                 )
             else:
                 searchResults = []
+                if is_empty_str(uri) and all(
+                    is_empty_str(name)
+                    for name in (
+                        trackName,
+                        showName,
+                        episodeName,
+                        audiobookName,
+                        genreName,
+                    )
+                ):
+                    # the account's own library comes before search
+                    uri = spotcast_controller.library_index.lookup(
+                        account or "default",
+                        playlistName=playlistName,
+                        albumName=albumName,
+                        artistName=artistName,
+                    )
+
                 if is_empty_str(uri):
                     # get uri from search request
-                    searchResults = get_search_results(
-                        spotify_client=client,
-                        limit=limit,
-                        artistName=artistName,
-                        country=country,
-                        albumName=albumName,
-                        playlistName=playlistName,
-                        trackName=trackName,
-                        showName=showName,
-                        episodeName=episodeName,
-                        audiobookName=audiobookName,
-                        genreName=genreName,
+                    searchResults = await hass.async_add_executor_job(
+                        partial(
+                            get_search_results,
+                            spotify_client=client,
+                            limit=limit,
+                            artistName=artistName,
+                            country=country,
+                            albumName=albumName,
+                            playlistName=playlistName,
+                            trackName=trackName,
+                            showName=showName,
+                            episodeName=episodeName,
+                            audiobookName=audiobookName,
+                            genreName=genreName,
+                            artist_index=spotcast_controller.artist_index,
+                        )
                     )
                     # play the first track
                     if len(searchResults) > 0:
                         uri = searchResults[0]["uri"]
 
-                spotcast_controller.play(
-                    client,
-                    spotify_device_id,
-                    uri,
-                    random_song,
-                    position,
-                    ignore_fully_played,
-                    start_position,
+                uri = await async_playback(
+                    lambda device_id: spotcast_controller.play(
+                        client,
+                        device_id,
+                        uri,
+                        random_song,
+                        position,
+                        ignore_fully_played,
+                        start_position,
+                    )
                 )
 
                 if len(searchResults) > 1:
-                    add_tracks_to_queue(client, searchResults[1:])
-
-            if start_volume <= 100:
-                _LOGGER.debug("Setting volume to %d", start_volume)
-                time.sleep(2)
-                client.volume(volume_percent=start_volume,
-                              device_id=spotify_device_id)
-            if shuffle:
-                _LOGGER.debug("Turning shuffle on")
-                time.sleep(3)
-                client.shuffle(state=shuffle, device_id=spotify_device_id)
-            if repeat:
-                _LOGGER.debug("Turning repeat on")
-                time.sleep(3)
-                client.repeat(state=repeat, device_id=spotify_device_id)
+                    # fill the queue in the background, playback already
+                    # started
+                    queue_client = (
+                        await spotcast_controller.async_get_spotify_client(
+                            account, PRIORITY_BACKGROUND
+                        )
+                    )
+                    hass.async_create_background_task(
+                        async_add_tracks_to_queue(
+                            hass, queue_client, searchResults[1:]
+                        ),
+                        f"{DOMAIN}_queue_loading",
+                    )
+
+            # wait for the device to play the new context, then apply
+            # the playback settings together
+            await async_apply_playback_settings(
+                hass,
+                client,
+                spotify_device_id,
+                uri,
+                volume=start_volume if start_volume <= 100 else None,
+                shuffle=True if shuffle else None,
+                repeat=repeat if repeat else None,
+            )
+
+            # push the new player state to the subscribers right away
+            spotcast_controller.get_player_poller(account).async_poke()
 
         except Exception as exc:
             if DEBUG:
@@ -386,6 +604,12 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
         handler=websocket_handle_playlists,
         schema=SCHEMA_PLAYLISTS,
     )
+    websocket_api.async_register_command(
+        hass=hass,
+        command_or_handler=WS_TYPE_SPOTCAST_PLAYLISTS_SUBSCRIBE,
+        handler=websocket_handle_playlists_subscribe,
+        schema=SCHEMA_WS_PLAYLISTS_SUBSCRIBE,
+    )
     websocket_api.async_register_command(
         hass=hass,
         command_or_handler=WS_TYPE_SPOTCAST_DEVICES,
@@ -399,6 +623,13 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
         schema=SCHEMA_WS_PLAYER,
     )
 
+    websocket_api.async_register_command(
+        hass=hass,
+        command_or_handler=WS_TYPE_SPOTCAST_PLAYER_SUBSCRIBE,
+        handler=websocket_handle_player_subscribe,
+        schema=SCHEMA_WS_PLAYER_SUBSCRIBE,
+    )
+
     websocket_api.async_register_command(
         hass=hass,
         command_or_handler=WS_TYPE_SPOTCAST_ACCOUNTS,
@@ -413,10 +644,17 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
         schema=SCHEMA_WS_CASTDEVICES,
     )
 
-    hass.services.register(
+    websocket_api.async_register_command(
+        hass=hass,
+        command_or_handler=WS_TYPE_SPOTCAST_STATS,
+        handler=websocket_handle_stats,
+        schema=SCHEMA_WS_STATS,
+    )
+
+    hass.services.async_register(
         domain=DOMAIN,
         service="start",
-        service_func=start_casting,
+        service_func=async_start_casting,
         schema=SERVICE_START_COMMAND_SCHEMA,
     )
 
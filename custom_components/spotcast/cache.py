@@ -0,0 +1,87 @@
+"""Module for the in-memory caches of spotcast"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """Bounded mapping whose entries expire after `ttl` seconds. When
+    full, the least recently used entry is evicted. Safe to share
+    between the event loop and executor threads."""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Provides the value of a key if present and not expired"""
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is None or entry[0] <= time.monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        """Adds or replaces a key, optionally with its own ttl"""
+        if ttl is None:
+            ttl = self.ttl
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes a key and provides its value, expired or not"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+
+        return default if entry is None else entry[1]
+
+    def invalidate(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Removes the entries for which `predicate(key, value)` is
+        true. Returns the number of entries removed"""
+        with self._lock:
+            keys = [
+                key
+                for key, (_, value) in self._data.items()
+                if predicate(key, value)
+            ]
+
+            for key in keys:
+                del self._data[key]
+
+        return len(keys)
+
+    def clear(self):
+        """Removes all entries"""
+        with self._lock:
+            self._data.clear()
+
+    @property
+    def stats(self) -> dict:
+        """Provides the size and hit/miss counters of the cache"""
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,164 @@
+"""Module keeping the connections to chromecast devices alive between
+casts"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+from uuid import UUID
+
+import homeassistant.core as ha_core
+import pychromecast
+from homeassistant.components.cast.helpers import (
+    ChromecastInfo,
+    ChromeCastZeroconf,
+)
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.event import async_track_time_interval
+
+from .spotify_controller import SpotifyController
+
+_LOGGER = logging.getLogger(__name__)
+
+CHROMECAST_IDLE_TTL = 600
+CHROMECAST_CONNECT_TIMEOUT = 10
+CLEANUP_INTERVAL = timedelta(seconds=60)
+
+
+class PooledChromecast:
+    """A connected chromecast and the spotify controller registered on
+    it. Launches of the spotify app must hold `launch_lock`"""
+
+    def __init__(self, cast: pychromecast.Chromecast):
+        self.cast = cast
+        self.spotify_controller: SpotifyController = None
+        # serializes the spotify app launches on the chromecast
+        self.launch_lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+    @property
+    def is_healthy(self) -> bool:
+        """Checks the socket is still connected and reports a status"""
+        return self.cast.socket_client.is_connected and self.cast.status is not None
+
+    def disconnect(self):
+        """Closes the connection and stops the socket thread"""
+        try:
+            self.cast.disconnect(timeout=CHROMECAST_CONNECT_TIMEOUT)
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.debug("Failed to disconnect %s: %s", self.cast, exc)
+
+
+class ChromecastPool:
+    """Reuses connected Chromecast objects across casts, keyed by cast
+    UUID. Unhealthy connections are replaced and idle ones are closed
+    after `idle_ttl` seconds"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        idle_ttl: float = CHROMECAST_IDLE_TTL,
+    ):
+        self.hass = hass
+        self.idle_ttl = idle_ttl
+        self._entries: dict[UUID, PooledChromecast] = {}
+        self._lock = threading.Lock()
+        self._cancel_cleanup = None
+
+    @callback
+    def async_start(self):
+        """Starts closing idle connections and closes all of them when
+        Home Assistant stops"""
+        self._cancel_cleanup = async_track_time_interval(
+            self.hass, self._async_cleanup, CLEANUP_INTERVAL
+        )
+        self.hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_STOP, self._async_shutdown
+        )
+
+    def get(self, cast_info: ChromecastInfo) -> PooledChromecast:
+        """Provides a connected chromecast for the cast info. Blocks
+        while connecting, so must run in the executor"""
+        stale = None
+
+        with self._lock:
+            entry = self._entries.get(cast_info.uuid)
+
+            if entry is not None and (
+                not entry.is_healthy or entry.cast.cast_info != cast_info.cast_info
+            ):
+                stale = self._entries.pop(cast_info.uuid)
+                entry = None
+
+        if stale is not None:
+            _LOGGER.debug("Replacing stale connection to %s", stale.cast)
+            stale.disconnect()
+
+        if entry is None:
+            entry = self._connect(cast_info)
+
+        entry.last_used = time.monotonic()
+        return entry
+
+    def reset_sessions(self, spotify_device_id: str):
+        """Forgets the Spotify sessions started on the chromecast with
+        the spotify device id"""
+        with self._lock:
+            entries = list(self._entries.values())
+
+        for entry in entries:
+            controller = entry.spotify_controller
+
+            if controller is not None and controller.device == spotify_device_id:
+                controller.reset_session()
+
+    def _connect(self, cast_info: ChromecastInfo) -> PooledChromecast:
+        cast = pychromecast.get_chromecast_from_cast_info(
+            cast_info.cast_info, ChromeCastZeroconf.get_zeroconf()
+        )
+        cast.wait(timeout=CHROMECAST_CONNECT_TIMEOUT)
+        entry = PooledChromecast(cast)
+
+        if not entry.is_healthy:
+            entry.disconnect()
+            raise HomeAssistantError(
+                f"Could not connect to {cast_info.friendly_name}"
+            )
+
+        with self._lock:
+            current = self._entries.setdefault(cast_info.uuid, entry)
+
+        # another call connected to the same device in the meantime
+        if current is not entry:
+            entry.disconnect()
+
+        return current
+
+    async def _async_cleanup(self, _now=None):
+        """Closes the connections unused for more than `idle_ttl`"""
+        limit = time.monotonic() - self.idle_ttl
+
+        with self._lock:
+            idle = [
+                uuid
+                for uuid, entry in self._entries.items()
+                if entry.last_used < limit
+            ]
+            entries = [self._entries.pop(uuid) for uuid in idle]
+
+        for entry in entries:
+            _LOGGER.debug("Closing idle connection to %s", entry.cast)
+            await self.hass.async_add_executor_job(entry.disconnect)
+
+    async def _async_shutdown(self, _event=None):
+        if self._cancel_cleanup is not None:
+            self._cancel_cleanup()
+            self._cancel_cleanup = None
+
+        self.idle_ttl = 0
+        await self._async_cleanup()
@@ -33,6 +33,19 @@ CONF_SP_DC = "sp_dc"
 CONF_SP_KEY = "sp_key"
 CONF_START_VOL = "start_volume"
 CONF_IGNORE_FULLY_PLAYED = "ignore_fully_played"
+CONF_TOKEN_REFRESH_MARGIN = "token_refresh_margin"
+CONF_DEVICE_WAIT_TIMEOUT = "device_wait_timeout"
+CONF_TRUST_CAST_DEVICE_ID = "trust_cast_device_id"
+
+DEFAULT_TOKEN_REFRESH_MARGIN = 300
+DEFAULT_DEVICE_WAIT_TIMEOUT = 15
+
+EVENT_QUEUE_LOADED = f"{DOMAIN}_queue_loaded"
+
+STORAGE_VERSION = 1
+STORAGE_KEY_TOKENS = f"{DOMAIN}.tokens"
+STORAGE_KEY_ARTISTS = f"{DOMAIN}.artists"
+STORAGE_KEY_LIBRARY = f"{DOMAIN}.library"
 
 WS_TYPE_SPOTCAST_PLAYLISTS = "spotcast/playlists"
 
@@ -44,6 +57,20 @@ SCHEMA_PLAYLISTS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
         vol.Optional("country_code"): str,
         vol.Optional("locale"): str,
         vol.Optional("account"): str,
+        vol.Optional("force_refresh"): bool,
+    }
+)
+
+WS_TYPE_SPOTCAST_PLAYLISTS_SUBSCRIBE = "spotcast/playlists/subscribe"
+
+SCHEMA_WS_PLAYLISTS_SUBSCRIBE = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SPOTCAST_PLAYLISTS_SUBSCRIBE,
+        vol.Required("playlist_type"): str,
+        vol.Optional("page_size"): vol.All(int, vol.Range(min=1, max=50)),
+        vol.Optional("country_code"): str,
+        vol.Optional("locale"): str,
+        vol.Optional("account"): str,
     }
 )
 
@@ -63,6 +90,14 @@ SCHEMA_WS_PLAYER = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
     }
 )
 
+WS_TYPE_SPOTCAST_PLAYER_SUBSCRIBE = "spotcast/player/subscribe"
+SCHEMA_WS_PLAYER_SUBSCRIBE = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SPOTCAST_PLAYER_SUBSCRIBE,
+        vol.Optional("account"): str,
+    }
+)
+
 WS_TYPE_SPOTCAST_ACCOUNTS = "spotcast/accounts"
 SCHEMA_WS_ACCOUNTS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
     {
@@ -77,6 +112,13 @@ SCHEMA_WS_CASTDEVICES = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
     }
 )
 
+WS_TYPE_SPOTCAST_STATS = "spotcast/stats"
+SCHEMA_WS_STATS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SPOTCAST_STATS,
+    }
+)
+
 SERVICE_START_COMMAND_SCHEMA = vol.Schema(
     {
         vol.Optional(CONF_DEVICE_NAME): cv.string,
@@ -121,6 +163,15 @@ SPOTCAST_CONFIG_SCHEMA = vol.Schema(
                 vol.Required(CONF_SP_KEY): cv.string,
                 vol.Optional(CONF_ACCOUNTS): cv.schema_with_slug_keys(ACCOUNTS_SCHEMA),
                 vol.Optional(CONF_SPOTIFY_COUNTRY): cv.string,
+                vol.Optional(
+                    CONF_TOKEN_REFRESH_MARGIN,
+                    default=DEFAULT_TOKEN_REFRESH_MARGIN,
+                ): cv.positive_int,
+                vol.Optional(
+                    CONF_DEVICE_WAIT_TIMEOUT,
+                    default=DEFAULT_DEVICE_WAIT_TIMEOUT,
+                ): cv.positive_int,
+                vol.Optional(CONF_TRUST_CAST_DEVICE_ID, default=False): cv.boolean,
             }
         ),
     },
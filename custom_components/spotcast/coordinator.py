@@ -0,0 +1,69 @@
+"""Module for the data update coordinators of spotcast"""
+
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import Awaitable, Callable
+
+import homeassistant.core as ha_core
+import spotipy
+from homeassistant.helpers.update_coordinator import (
+    DataUpdateCoordinator,
+    UpdateFailed,
+)
+
+from .library import fetch_user_playlists, invalidate_changed_snapshots
+
+_LOGGER = logging.getLogger(__name__)
+
+PLAYLISTS_UPDATE_INTERVAL = timedelta(seconds=60)
+PLAYLISTS_MAX_UPDATE_INTERVAL = timedelta(minutes=15)
+
+
+class PlaylistsCoordinator(DataUpdateCoordinator[dict[str, list]]):
+    """Fetches the name and snapshot id of every playlist of an account.
+    Listeners are only notified when a playlist changed, and the update
+    interval doubles while nothing changes"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        account: str,
+        async_get_client: Callable[[str], Awaitable[spotipy.Spotify]],
+    ):
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f"spotcast playlists {account}",
+            update_interval=PLAYLISTS_UPDATE_INTERVAL,
+            always_update=False,
+        )
+        self.account = account
+        self._async_get_client = async_get_client
+
+    async def _async_update_data(self) -> dict[str, list]:
+        try:
+            client = await self._async_get_client(self.account)
+            playlists = await self.hass.async_add_executor_job(
+                fetch_user_playlists, client
+            )
+        except Exception as exc:
+            raise UpdateFailed(exc) from exc
+
+        if playlists == self.data:
+            self.update_interval = min(
+                self.update_interval * 2, PLAYLISTS_MAX_UPDATE_INTERVAL
+            )
+            _LOGGER.debug(
+                "Playlists of %s unchanged, next update in %s",
+                self.account,
+                self.update_interval,
+            )
+            return playlists
+
+        self.update_interval = PLAYLISTS_UPDATE_INTERVAL
+
+        invalidate_changed_snapshots(self.data, playlists)
+
+        return playlists
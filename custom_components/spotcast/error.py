@@ -1,5 +1,23 @@
+import math
+
+from spotipy import SpotifyException
+
+
 class LaunchError(Exception):
     """When an app fails to launch."""
 
 class TokenError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class RateLimitError(SpotifyException):
+    """When spotify asked to pause requests for longer than we wait"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            429,
+            -1,
+            f"Spotify rate limit reached, retry in {retry_after:.0f} seconds",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+        self.retry_after = retry_after
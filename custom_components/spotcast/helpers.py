@@ -4,7 +4,6 @@ import asyncio
 import logging
 import requests
 import urllib.parse
-import difflib
 from urllib.parse import unquote as urldecode
 import random
 import time
@@ -21,8 +20,29 @@ from homeassistant.exceptions import HomeAssistantError
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers import entity_platform
 
+from .cache import TTLCache
+from .const import EVENT_QUEUE_LOADED
+from .library import ArtistIndex
+
 _LOGGER = logging.getLogger(__name__)
 
+QUEUE_MIN_DELAY = 0.05
+QUEUE_MAX_DELAY = 5
+QUEUE_RETRY_DELAY = 1
+
+SEARCH_CACHE_TTL = 3600
+TOP_TRACKS_CACHE_TTL = 600
+
+PLAYBACK_CONFIRM_TIMEOUT = 5
+PLAYBACK_POLL_MIN_INTERVAL = 0.1
+PLAYBACK_POLL_MAX_INTERVAL = 1
+
+# compact (uri, name, type) results of recent searches
+SEARCH_CACHE = TTLCache(maxsize=256, ttl=SEARCH_CACHE_TTL)
+
+# compact (uri, name, type) top tracks per (artist uri, market)
+TOP_TRACKS_CACHE = TTLCache(maxsize=128, ttl=TOP_TRACKS_CACHE_TTL)
+
 
 def get_spotify_media_player(
     hass: ha_core.HomeAssistant, spotify_user_id: str
@@ -69,13 +89,20 @@ def get_spotify_devices(
         hass: HomeAssistant
 ):
 
+    return asyncio.run_coroutine_threadsafe(
+        async_get_spotify_devices(spotify_media_player),
+        hass.loop,
+    ).result()
+
+
+async def async_get_spotify_devices(
+        spotify_media_player: SpotifyMediaPlayer,
+):
+
     if spotify_media_player:
         # Need to come from media_player spotify's sp client due to
         # token issues
-        asyncio.run_coroutine_threadsafe(
-            spotify_media_player.devices.async_refresh(),
-            hass.loop,
-        ).result()
+        await spotify_media_player.devices.async_refresh()
 
         spotify_devices = spotify_media_player.devices.data
 
@@ -98,19 +125,29 @@ def get_spotify_install_status(hass):
 
 
 def get_cast_devices(hass):
+    return list(get_cast_entity_infos(hass).values())
+
+
+def get_cast_entity_infos(hass, entity_id: str = None) -> dict:
+    """Provides the cast info of each cast media player, by entity id.
+    Optionally only looks for the given entity"""
     platforms = entity_platform.async_get_platforms(hass, "cast")
-    cast_infos = []
+    cast_infos = {}
     for platform in platforms:
         if platform.domain != "media_player":
             continue
-        for entity in platform.entities.values():
+        if entity_id is None:
+            entities = platform.entities.values()
+        else:
+            entities = [platform.entities.get(entity_id)]
+        for entity in entities:
             if isinstance(entity, CastDevice):
                 _LOGGER.debug(
                     f"get_cast_devices: {entity.entity_id}: "
                     f"{entity.name} cast info: % s",
                     entity._cast_info,
                 )
-                cast_infos.append(entity._cast_info)
+                cast_infos[entity.entity_id] = entity._cast_info
     return cast_infos
 
 
@@ -131,36 +168,58 @@ def get_top_tracks(
     spotify_client: spotipy.Spotify,
     limit: int = 20,
     country: str = None,
+    artist_index: ArtistIndex = None,
 ):
 
     _LOGGER.debug("Searching for top tracks for the artist: %s", artistName)
     searchType = "artist"
     search = searchType + ":" + artistName
 
-    artistUri = ""
+    artistUri = None
+
+    if artist_index is not None:
+        artistUri = artist_index.get(artistName)
 
     # get artist uri
-    try:
+    if artistUri is None:
+        artistUri = ""
 
-        artist = spotify_client.search(
-            q=search,
-            limit=1,
-            offset=0,
-            type="artist",
-            market=country,
-        )["artists"]["items"][0]
+        try:
+
+            artist = spotify_client.search(
+                q=search,
+                limit=1,
+                offset=0,
+                type="artist",
+                market=country,
+            )["artists"]["items"][0]
 
-        _LOGGER.debug("found artist %s: %s", artist["name"], artist["uri"])
-        artistUri = artist["uri"]
+            _LOGGER.debug("found artist %s: %s", artist["name"], artist["uri"])
+            artistUri = artist["uri"]
 
-    except IndexError:
-        pass
+            if artist_index is not None:
+                artist_index.set(artistName, artistUri)
 
-    results = spotify_client.artist_top_tracks(artistUri)
-    for track in results["tracks"][:10]:
-        _LOGGER.debug("track    : " + track["name"])
+        except IndexError:
+            pass
 
-    return results["tracks"]
+    cache_key = (artistUri, country)
+    tracks = TOP_TRACKS_CACHE.get(cache_key)
+
+    if tracks is None:
+        results = spotify_client.artist_top_tracks(
+            artistUri, country=country or "US"
+        )
+        tracks = tuple(
+            (track["uri"], track["name"], track["type"])
+            for track in results["tracks"]
+        )
+        TOP_TRACKS_CACHE.set(cache_key, tracks)
+
+    for _, name, _ in tracks[:10]:
+        _LOGGER.debug("track    : " + name)
+
+    return [{"uri": uri, "name": name, "type": type_} for uri, name, type_ in tracks]
 
 
 def get_search_string(
@@ -236,6 +295,84 @@ def get_search_results(
     episodeName: str = None,
     audiobookName: str = None,
     genreName: str = None,
+    artist_index: ArtistIndex = None,
+) -> list[dict]:
+    """Provides the uri, name and type of the items matching the search.
+    Results are cached for identical searches"""
+    searchString = get_search_string(
+        artistName=artistName,
+        albumName=albumName,
+        trackName=trackName,
+        genreName=genreName,
+        playlistName=playlistName,
+        showName=showName,
+        episodeName=episodeName,
+        audiobookName=audiobookName,
+    )
+    searchTypes = get_types_string(
+        artistName=artistName,
+        albumName=albumName,
+        trackName=trackName,
+        playlistName=playlistName,
+        showName=showName,
+        episodeName=episodeName,
+        audiobookName=audiobookName,
+    )
+    cache_key = (
+        " ".join(searchString.lower().split()),
+        searchTypes,
+        country,
+        limit,
+    )
+
+    results = SEARCH_CACHE.get(cache_key)
+
+    if results is None:
+        results = tuple(
+            (item["uri"], item["name"], item["type"])
+            for item in _get_search_results(
+                spotify_client=spotify_client,
+                limit=limit,
+                country=country,
+                artistName=artistName,
+                albumName=albumName,
+                playlistName=playlistName,
+                trackName=trackName,
+                showName=showName,
+                episodeName=episodeName,
+                audiobookName=audiobookName,
+                genreName=genreName,
+                artist_index=artist_index,
+            )
+            if item is not None
+        )
+
+        # artist only searches give top tracks, which change more often
+        artist_only = searchTypes == "artist" and is_empty_str(genreName)
+        SEARCH_CACHE.set(
+            cache_key,
+            results,
+            ttl=TOP_TRACKS_CACHE_TTL if artist_only else None,
+        )
+    else:
+        _LOGGER.debug("Using cached search results for %s", cache_key[0])
+
+    return [{"uri": uri, "name": name, "type": type_} for uri, name, type_ in results]
+
+
+def _get_search_results(
+    spotify_client: spotipy.Spotify,
+    limit: int = 10,
+    country: str = None,
+    artistName: str = None,
+    albumName: str = None,
+    playlistName: str = None,
+    trackName: str = None,
+    showName: str = None,
+    episodeName: str = None,
+    audiobookName: str = None,
+    genreName: str = None,
+    artist_index: ArtistIndex = None,
 ):
     _LOGGER.debug("using search query to find uri")
     searchResults = []
@@ -260,7 +397,12 @@ def get_search_results(
         )
         == 0
     ):
-        searchResults = get_top_tracks(artistName, spotify_client)
+        searchResults = get_top_tracks(
+            artistName,
+            spotify_client,
+            country=country,
+            artist_index=artist_index,
+        )
         _LOGGER.debug("Playing top tracks for artist: %s",
                       searchResults[0]["name"])
         return searchResults
@@ -347,94 +489,255 @@ def search_tracks(
     return results
 
 
-def add_tracks_to_queue(
-    spotify_client: spotipy.Spotify, tracks: list = [], limit: int = 20
-):
+def get_retry_after(exc: SpotifyException) -> float:
+    """Provides the delay requested by spotify in the `Retry-After`
+    header of a failed request, if any"""
+    headers = getattr(exc, "headers", None) or {}
+
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+async def async_add_tracks_to_queue(
+    hass: HomeAssistant,
+    spotify_client: spotipy.Spotify,
+    tracks: list = [],
+    limit: int = 20,
+    max_attempts: int = 5,
+) -> tuple[int, list[str]]:
+    """Adds the tracks to the playback queue. The delay between requests
+    shrinks while they succeed and grows when spotify throttles them,
+    following `Retry-After` when provided. Returns the number of tracks
+    added and the uris that failed"""
     filtered = list(filter(lambda x: isinstance(x, dict)
                     and x.get("type") == "track", tracks))
 
     if len(filtered) == 0:
         _LOGGER.debug("Cannot add ZERO tracks to the queue!")
-        return
+        return 0, []
 
-    for track in filtered[:limit]:
+    filtered = filtered[:limit]
+    delay = QUEUE_MIN_DELAY
+    added = 0
+    failed = []
+
+    # requests stay sequential, as the queue keeps the order they arrive in
+    for track in filtered:
         _LOGGER.debug(
             "Adding " + track["name"] +
             " to the playback queue | " + track["uri"]
         )
 
-        max_attemps = 5
-        backoff_rate = 1.2
-        delay = 1
         current_attempt = 0
 
         while True:
             try:
-                spotify_client.add_to_queue(track["uri"])
+                await hass.async_add_executor_job(
+                    spotify_client.add_to_queue, track["uri"]
+                )
             except SpotifyException as exc:
+                current_attempt += 1
 
-                if current_attempt >= max_attemps:
-                    raise HomeAssistantError(
-                        "Coulddn't addd song to queue"
-                    ) from exc
-
-                _LOGGER.warning("Couldn't add song to queue retrying")
+                if current_attempt >= max_attempts:
+                    _LOGGER.warning(
+                        "Couldn't add %s to queue: %s", track["uri"], exc
+                    )
+                    failed.append(track["uri"])
+                    break
 
-                time.sleep(delay)
-                current_attempt += 1
-                delay *= backoff_rate
+                if exc.http_status == 429:
+                    delay = min(delay * 2, QUEUE_MAX_DELAY)
 
+                retry_after = get_retry_after(exc)
+                wait = max(delay, retry_after or 0, QUEUE_RETRY_DELAY)
+                _LOGGER.debug(
+                    "Couldn't add song to queue, retrying in %.2f seconds",
+                    wait,
+                )
+                await asyncio.sleep(wait)
                 continue
 
+            added += 1
+            delay = max(delay * 0.75, QUEUE_MIN_DELAY)
             break
 
-        time.sleep(0.5)
+        _LOGGER.debug(
+            "Queue loading progress: %d/%d tracks added, %d failed",
+            added,
+            len(filtered),
+            len(failed),
+        )
+        await asyncio.sleep(delay)
 
+    hass.bus.async_fire(
+        EVENT_QUEUE_LOADED,
+        {"added": added, "failed": failed},
+    )
 
-def get_random_playlist_from_category(
-    spotify_client: spotipy.Spotify,
-    category: str,
-    country: str = None,
-    limit: int = 20,
-) -> str:
+    if failed:
+        _LOGGER.warning(
+            "Added %d tracks to the queue, %d failed", added, len(failed)
+        )
 
-    if country is None:
+    return added, failed
 
-        _LOGGER.debug(
-            f"Get random playlist among {limit} playlists from category "
-            f"{category}, no country specified."
-        )
 
-    else:
+def _uri_id(uri: str) -> str:
+    """Provides the id part of a spotify URI or web URL"""
+    if uri is None:
+        return None
+    return uri.split("?")[0].rstrip("/").replace("/", ":").split(":")[-1]
 
-        _LOGGER.debug(
-            f"Get random playlist among {limit} playlists from category "
-            f"{category} in country {country}"
+
+def is_playback_started(playback: dict, device_id: str, uri: str = None) -> bool:
+    """Checks if the playback reported by spotify runs on the device and,
+    if provided, plays the uri (either as its context or its item)"""
+    if not playback or not playback.get("device"):
+        return False
+
+    if playback["device"].get("id") != device_id:
+        return False
+
+    if uri is None:
+        return True
+
+    context = playback.get("context") or {}
+    item = playback.get("item") or {}
+    return _uri_id(uri) in (_uri_id(context.get("uri")), _uri_id(item.get("uri")))
+
+
+async def async_wait_for_playback(
+    hass: HomeAssistant,
+    spotify_client: spotipy.Spotify,
+    device_id: str,
+    uri: str = None,
+    timeout: float = PLAYBACK_CONFIRM_TIMEOUT,
+) -> tuple[bool, dict]:
+    """Polls the player until the device reports the new playback. The
+    polling starts fast and slows down the longer it takes. Returns if
+    the playback was confirmed and the last state received"""
+    deadline = time.monotonic() + timeout
+    interval = PLAYBACK_POLL_MIN_INTERVAL
+
+    while True:
+        playback = await hass.async_add_executor_job(
+            spotify_client.current_playback
         )
 
-        # validate category and country are valid entries
-        if country.upper() not in spotify_client.country_codes:
-            _LOGGER.error(f"{country} is not a valid country code")
-            return None
+        if is_playback_started(playback, device_id, uri):
+            return True, playback
 
-    # get list of playlist from category and localisation provided
-    try:
-        playlists = spotify_client.category_playlists(
-            category_id=category, country=country, limit=limit
-        )["playlists"]["items"]
-    except spotipy.exceptions.SpotifyException as e:
-        _LOGGER.error(e.msg)
-        return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _LOGGER.debug(
+                "Device %s didn't confirm playback of %s in %s seconds",
+                device_id,
+                uri,
+                timeout,
+            )
+            return False, playback
+
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 1.5, PLAYBACK_POLL_MAX_INTERVAL)
+
+
+def _pending_settings(playback: dict, settings: dict) -> dict:
+    """Provides the settings not yet reflected in the playback state"""
+    if not playback:
+        return dict(settings)
+
+    current = {
+        "volume": (playback.get("device") or {}).get("volume_percent"),
+        "shuffle": playback.get("shuffle_state"),
+        "repeat": playback.get("repeat_state"),
+    }
 
-    # choose one at random
-    chosen = random.choice(playlists)
+    # some devices never report their volume, consider it applied
+    if current["volume"] is None:
+        current["volume"] = settings.get("volume")
 
-    _LOGGER.debug(
-        f"Chose playlist {chosen['name']}({chosen['uri']}) from category "
-        f"{category}."
+    return {
+        name: value
+        for name, value in settings.items()
+        if current[name] != value
+    }
+
+
+async def async_apply_playback_settings(
+    hass: HomeAssistant,
+    spotify_client: spotipy.Spotify,
+    device_id: str,
+    uri: str = None,
+    volume: int = None,
+    shuffle: bool = None,
+    repeat: str = None,
+    max_attempts: int = 3,
+):
+    """Applies volume, shuffle and repeat once the device plays the uri.
+    The settings are sent together and only the ones the player doesn't
+    report afterward are retried"""
+    settings = {
+        name: value
+        for name, value in (
+            ("volume", volume),
+            ("shuffle", shuffle),
+            ("repeat", repeat),
+        )
+        if value is not None
+    }
+
+    if not settings:
+        return
+
+    setters = {
+        "volume": lambda value: spotify_client.volume(
+            volume_percent=value, device_id=device_id
+        ),
+        "shuffle": lambda value: spotify_client.shuffle(
+            state=value, device_id=device_id
+        ),
+        "repeat": lambda value: spotify_client.repeat(
+            state=value, device_id=device_id
+        ),
+    }
+
+    _, playback = await async_wait_for_playback(
+        hass, spotify_client, device_id, uri
     )
+    pending = _pending_settings(playback, settings)
+    attempt = 0
+
+    while pending:
+        attempt += 1
+        _LOGGER.debug("Applying playback settings: %s", pending)
+
+        results = await asyncio.gather(
+            *(
+                hass.async_add_executor_job(setters[name], value)
+                for name, value in pending.items()
+            ),
+            return_exceptions=True,
+        )
+
+        for name, result in zip(pending, results):
+            if isinstance(result, Exception):
+                _LOGGER.debug("Failed to set %s: %s", name, result)
 
-    return chosen["uri"]
+        await asyncio.sleep(PLAYBACK_POLL_MIN_INTERVAL * attempt)
+        playback = await hass.async_add_executor_job(
+            spotify_client.current_playback
+        )
+        pending = _pending_settings(playback, pending)
+
+        if pending and attempt >= max_attempts:
+            _LOGGER.warning(
+                "Device %s didn't apply playback settings %s",
+                device_id,
+                pending,
+            )
+            return
 
 
 def url_to_spotify_uri(url: str) -> str:
@@ -0,0 +1,685 @@
+"""Module for the local copies of spotify catalog data, kept in Home
+Assistant storage"""
+
+from __future__ import annotations
+
+import asyncio
+import difflib
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, Iterator
+
+import homeassistant.core as ha_core
+import spotipy
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .cache import TTLCache
+from .const import STORAGE_KEY_ARTISTS, STORAGE_KEY_LIBRARY, STORAGE_VERSION
+
+_LOGGER = logging.getLogger(__name__)
+
+STORE_SAVE_DELAY = 10
+ARTIST_INDEX_MAX_SIZE = 1000
+CATEGORY_POOL_SIZE = 50
+CATEGORY_POOL_IDLE_TTL = 7 * 24 * 3600
+CATEGORY_POOL_REFRESH_INTERVAL = timedelta(hours=6)
+CONTEXT_SIZE_TTL = {
+    "album": 24 * 3600,
+    "playlist": 600,
+    "collection": 60,
+}
+
+SHOW_EPISODES_PAGE_SIZE = 50
+LIBRARY_PAGE_SIZE = 50
+LIBRARY_SYNC_INTERVAL = timedelta(minutes=30)
+LIBRARY_MATCH_CUTOFF = 0.85
+SHOW_RESUME_TTL = 24 * 3600
+
+# (snapshot id, number of tracks) per context uri
+CONTEXT_SIZE_CACHE = TTLCache(maxsize=256, ttl=600)
+
+# (number of episodes, index of the first unplayed episode) per
+# (account, show uri)
+SHOW_RESUME_CACHE = TTLCache(maxsize=64, ttl=SHOW_RESUME_TTL)
+
+
+def normalize_name(name: str) -> str:
+    """Provides the form of a name used as lookup key"""
+    return " ".join(name.lower().split())
+
+
+class ArtistIndex:
+    """Persistent mapping of artist names to their spotify uri. Safe to
+    use from executor threads"""
+
+    def __init__(self, hass: ha_core.HomeAssistant):
+        self.hass = hass
+        self._artists: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_ARTISTS)
+
+    async def async_load(self):
+        """Loads the artists saved by a previous run"""
+        self._artists = await self._store.async_load() or {}
+        _LOGGER.debug("Loaded %i artists in index", len(self._artists))
+
+    def get(self, name: str) -> str:
+        """Provides the uri of an artist, if known"""
+        return self._artists.get(normalize_name(name))
+
+    def set(self, name: str, uri: str):
+        """Adds an artist to the index and schedules saving it"""
+        key = normalize_name(name)
+
+        with self._lock:
+            if self._artists.get(key) == uri:
+                return
+
+            self._artists[key] = uri
+
+            # forget the oldest artists first
+            while len(self._artists) > ARTIST_INDEX_MAX_SIZE:
+                del self._artists[next(iter(self._artists))]
+
+        self.hass.loop.call_soon_threadsafe(self._async_schedule_save)
+
+    @callback
+    def _async_schedule_save(self):
+        self._store.async_delay_save(self._data_to_save, STORE_SAVE_DELAY)
+
+    def _data_to_save(self) -> dict:
+        with self._lock:
+            return dict(self._artists)
+
+
+def fetch_category_playlists(
+    spotify_client: spotipy.Spotify,
+    category: str,
+    country: str = None,
+    limit: int = CATEGORY_POOL_SIZE,
+) -> list[str]:
+    """Provides the uris of the playlists of a category, or None if the
+    category or country is invalid"""
+    # validate category and country are valid entries
+    if country is not None and country.upper() not in spotify_client.country_codes:
+        _LOGGER.error(f"{country} is not a valid country code")
+        return None
+
+    # get list of playlist from category and localisation provided
+    try:
+        playlists = spotify_client.category_playlists(
+            category_id=category, country=country, limit=limit
+        )["playlists"]["items"]
+    except spotipy.exceptions.SpotifyException as e:
+        _LOGGER.error(e.msg)
+        return None
+
+    return [playlist["uri"] for playlist in playlists if playlist is not None]
+
+
+class CategoryPlaylistPools:
+    """Playlists of the categories already played, per category and
+    country. Pools are filled on first use, refreshed in the background
+    and forgotten once unused for `idle_ttl` seconds"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        async_get_client: Callable[[str], Awaitable[spotipy.Spotify]],
+        idle_ttl: float = CATEGORY_POOL_IDLE_TTL,
+    ):
+        self.hass = hass
+        self.idle_ttl = idle_ttl
+        self._async_get_client = async_get_client
+        self._pools: dict[tuple[str, str], tuple[str, ...]] = {}
+        self._accounts: dict[tuple[str, str], str] = {}
+        self._last_used: dict[tuple[str, str], float] = {}
+        self._cancel_refresh = None
+
+    @callback
+    def async_start(self):
+        """Starts refreshing the pools in the background"""
+        self._cancel_refresh = async_track_time_interval(
+            self.hass, self._async_refresh_all, CATEGORY_POOL_REFRESH_INTERVAL
+        )
+        self.hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_STOP, self._async_shutdown
+        )
+
+    async def async_get_random_playlist(
+        self,
+        client: spotipy.Spotify,
+        account: str,
+        category: str,
+        country: str = None,
+        limit: int = 20,
+    ) -> str:
+        """Provides a random playlist among the first `limit` playlists
+        of a category. Only requests spotify, with `client`, the first
+        time a category is played in a country"""
+        key = (category, country.upper() if country else None)
+        pool = self._pools.get(key)
+
+        if pool is None:
+            _LOGGER.debug(
+                "Filling playlist pool of category %s in country %s", *key
+            )
+            pool = await self._async_fetch(client, key)
+
+            if pool is None:
+                return None
+
+        self._accounts[key] = account
+        self._last_used[key] = time.monotonic()
+
+        if not pool:
+            _LOGGER.error("No playlist found in category %s", category)
+            return None
+
+        # choose one at random
+        chosen = random.choice(pool[:limit])
+        _LOGGER.debug("Chose playlist %s from category %s.", chosen, category)
+
+        return chosen
+
+    async def _async_fetch(
+        self, client: spotipy.Spotify, key: tuple[str, str]
+    ) -> tuple[str, ...]:
+        category, country = key
+        uris = await self.hass.async_add_executor_job(
+            fetch_category_playlists, client, category, country
+        )
+
+        if uris is None:
+            return None
+
+        self._pools[key] = tuple(uris)
+        return self._pools[key]
+
+    async def _async_refresh_all(self, _now=None):
+        """Refreshes the pools in use and forgets the idle ones"""
+        limit = time.monotonic() - self.idle_ttl
+
+        for key, last_used in list(self._last_used.items()):
+            if last_used < limit:
+                _LOGGER.debug("Forgetting idle playlist pool %s", key)
+                self._pools.pop(key, None)
+                self._accounts.pop(key, None)
+                self._last_used.pop(key, None)
+                continue
+
+            try:
+                client = await self._async_get_client(self._accounts[key])
+                await self._async_fetch(client, key)
+            except Exception as exc:  # pylint: disable=broad-except
+                # keep the previous pool until the next refresh
+                _LOGGER.warning(
+                    "Failed to refresh playlist pool %s: %s", key, exc
+                )
+
+    @callback
+    def _async_shutdown(self, _event=None):
+        if self._cancel_refresh is not None:
+            self._cancel_refresh()
+            self._cancel_refresh = None
+
+
+def get_context_size(
+    spotify_client: spotipy.Spotify,
+    uri: str,
+    country: str = None,
+    use_cache: bool = True,
+) -> tuple[int, bool]:
+    """Provides the number of tracks of an album, playlist or saved
+    tracks collection, and whether it came from the cache. Only the
+    total is requested and it is cached per uri"""
+    entry = CONTEXT_SIZE_CACHE.get(uri) if use_cache else None
+
+    if entry is not None:
+        return entry[1], True
+
+    snapshot_id = None
+
+    if uri.find("album") > 0:
+        context_type = "album"
+        total = spotify_client.album_tracks(uri, limit=1, market=country)["total"]
+    elif uri.find("playlist") > 0:
+        context_type = "playlist"
+        playlist = spotify_client.playlist(uri, fields="snapshot_id,tracks.total")
+        snapshot_id = playlist["snapshot_id"]
+        total = playlist["tracks"]["total"]
+    elif uri.find("collection") > 0:
+        context_type = "collection"
+        total = spotify_client.current_user_saved_tracks(limit=1)["total"]
+    else:
+        raise ValueError(f"{uri} has no tracks count")
+
+    CONTEXT_SIZE_CACHE.set(
+        uri, (snapshot_id, int(total)), ttl=CONTEXT_SIZE_TTL[context_type]
+    )
+    return int(total), False
+
+
+def invalidate_snapshot(uri: str, snapshot_id: str):
+    """Forgets the cached size of a playlist if it was read from
+    another snapshot"""
+    entry = CONTEXT_SIZE_CACHE.get(uri)
+
+    if entry is not None and entry[0] != snapshot_id:
+        CONTEXT_SIZE_CACHE.pop(uri)
+
+
+def invalidate_changed_snapshots(old: dict[str, list], new: dict[str, list]):
+    """Forgets the cached sizes of the playlists whose snapshot changed
+    between two `fetch_user_playlists` results"""
+    # cached track counts of modified playlists are outdated
+    for uri, (_, snapshot_id) in new.items():
+        previous = (old or {}).get(uri)
+
+        if previous is not None and previous[1] != snapshot_id:
+            invalidate_snapshot(uri, snapshot_id)
+
+
+def iter_show_episodes(
+    spotify_client: spotipy.Spotify,
+    show_uri: str,
+    market: str = None,
+    offset: int = 0,
+    limit: int = SHOW_EPISODES_PAGE_SIZE,
+) -> Iterator[tuple[int, int, dict]]:
+    """Lazily iterates over the episodes of a show, newest first,
+    starting at `offset`. Yields the index of each episode, the number
+    of episodes of the show and the episode. Pages are only requested
+    when the previous one is exhausted"""
+    while True:
+        page = spotify_client.show_episodes(
+            show_uri, limit=limit, offset=offset, market=market
+        )
+
+        for index, episode in enumerate(page["items"], offset):
+            if episode is not None:
+                yield index, page["total"], episode
+
+        offset += len(page["items"])
+
+        if page["next"] is None or not page["items"]:
+            return
+
+
+def get_show_episode(
+    spotify_client: spotipy.Spotify,
+    show_uri: str,
+    market: str = None,
+    ignore_fully_played: bool = False,
+) -> dict:
+    """Provides the latest episode of a show, or the latest one not
+    fully played. The scan resumes at the episode found by the previous
+    call, unless episodes were published since. Returns None if there
+    is no such episode"""
+    if not ignore_fully_played:
+        return next(
+            (
+                episode
+                for _, _, episode in iter_show_episodes(
+                    spotify_client, show_uri, market, limit=1
+                )
+            ),
+            None,
+        )
+
+    key = (getattr(spotify_client, "account", None), show_uri)
+    resume = SHOW_RESUME_CACHE.get(key)
+    start = 0 if resume is None else resume[1]
+
+    for index, total, episode in iter_show_episodes(
+        spotify_client, show_uri, market, offset=start
+    ):
+        if resume is not None and resume[0] != total:
+            # episodes were published or removed, the indexes moved
+            break
+
+        if not episode["resume_point"]["fully_played"]:
+            SHOW_RESUME_CACHE.set(key, (total, index))
+            _LOGGER.debug("First unplayed episode of %s at %i", show_uri, index)
+            return episode
+
+    SHOW_RESUME_CACHE.pop(key)
+
+    if resume is not None:
+        # the resume point is outdated or past the last episode, scan
+        # the whole show before giving up
+        return get_show_episode(
+            spotify_client, show_uri, market, ignore_fully_played
+        )
+
+    return None
+
+
+def fetch_user_playlists(spotify_client: spotipy.Spotify) -> dict[str, list]:
+    """Pages through the playlists of the user and provides the name and
+    snapshot id of each, by uri. `me/playlists` has no fields filter, so
+    the rest of each item is dropped right away"""
+    playlists = {}
+    offset = 0
+
+    while True:
+        page = spotify_client.current_user_playlists(
+            limit=LIBRARY_PAGE_SIZE, offset=offset
+        )
+
+        for item in page["items"]:
+            if item is not None:
+                playlists[item["uri"]] = [item["name"], item["snapshot_id"]]
+
+        offset += len(page["items"])
+
+        if page["next"] is None or not page["items"]:
+            return playlists
+
+
+class LibraryIndex:
+    """Local copy of the playlists, saved albums and followed artists of
+    the accounts, to resolve names without searching spotify. Accounts
+    are indexed on their first lookup, then synced in the background.
+    Playlists come from the shared playlists coordinator of the account.
+    Only read and updated from the event loop"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        async_get_client: Callable[[str], Awaitable[spotipy.Spotify]],
+        get_playlists_coordinator: Callable[[str], DataUpdateCoordinator],
+        artist_index: ArtistIndex = None,
+    ):
+        self.hass = hass
+        self._async_get_client = async_get_client
+        self._get_playlists_coordinator = get_playlists_coordinator
+        self.artist_index = artist_index
+        self._playlists_listeners: dict[str, Callable] = {}
+        # account -> kind -> uri -> [name, snapshot id or album artist]
+        self._data: dict[str, dict[str, dict[str, list]]] = {}
+        self._names: dict[tuple[str, str], dict[str, str]] = {}
+        # account -> album artist -> album name -> uri
+        self._albums_by_artist: dict[str, dict[str, dict[str, str]]] = {}
+        self._sync_tasks: dict[str, asyncio.Task] = {}
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_LIBRARY)
+        self._cancel_sync = None
+
+    async def async_load(self):
+        """Loads the libraries saved by a previous run and syncs them"""
+        self._data = await self._store.async_load() or {}
+        self._names.clear()
+        self._albums_by_artist.clear()
+        _LOGGER.debug("Loaded library of accounts %s", list(self._data))
+
+        for account in self._data:
+            self.async_sync(account)
+
+    @callback
+    def async_start(self):
+        """Starts syncing the indexed accounts in the background"""
+        self._cancel_sync = async_track_time_interval(
+            self.hass, self._async_sync_all, LIBRARY_SYNC_INTERVAL
+        )
+        self.hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_STOP, self._async_shutdown
+        )
+
+    @callback
+    def match(self, account: str, kind: str, name: str, artist: str = None) -> str:
+        """Provides the uri of the playlist, album or artist of the
+        account closest to `name`, optionally only among the albums of
+        `artist`. Returns None if nothing is close enough"""
+        if account not in self._data:
+            self.async_sync(account)
+            return None
+
+        items = self._data[account].get(kind, {})
+
+        if artist is not None:
+            # albums of different artists can share a name, so they are
+            # indexed by artist first
+            albums_by_artist = self._albums_by_artist.get(account)
+
+            if albums_by_artist is None:
+                albums_by_artist = self._albums_by_artist[account] = {}
+
+                for uri, (album_name, album_artist) in items.items():
+                    albums = albums_by_artist.setdefault(
+                        normalize_name(album_artist), {}
+                    )
+                    albums[normalize_name(album_name)] = uri
+
+            artist = normalize_name(artist)
+
+            # only the artist names are compared, not every album
+            if artist not in albums_by_artist:
+                artist = next(
+                    iter(
+                        difflib.get_close_matches(
+                            artist,
+                            albums_by_artist,
+                            n=1,
+                            cutoff=LIBRARY_MATCH_CUTOFF,
+                        )
+                    ),
+                    None,
+                )
+
+            names = albums_by_artist.get(artist, {})
+        else:
+            names = self._names.get((account, kind))
+
+            if names is None:
+                names = self._names[(account, kind)] = {
+                    normalize_name(item[0]): uri for uri, item in items.items()
+                }
+
+        key = normalize_name(name)
+
+        if key not in names:
+            key = next(
+                iter(
+                    difflib.get_close_matches(
+                        key, names, n=1, cutoff=LIBRARY_MATCH_CUTOFF
+                    )
+                ),
+                None,
+            )
+
+        if key is None:
+            return None
+
+        _LOGGER.debug("Found %s in %s library: %s", name, account, names[key])
+        return names[key]
+
+    @callback
+    def lookup(
+        self,
+        account: str,
+        playlistName: str = None,
+        albumName: str = None,
+        artistName: str = None,
+    ) -> str:
+        """Provides the uri of a playlist, or of an album optionally
+        with its artist, found in the library. Artists alone are played
+        from their top tracks, so followed artists are only added to the
+        artist index"""
+        if playlistName and not albumName and not artistName:
+            return self.match(account, "playlists", playlistName)
+
+        if albumName and not playlistName:
+            return self.match(account, "albums", albumName, artistName or None)
+
+        if artistName and not playlistName and self.artist_index is not None:
+            uri = self.match(account, "artists", artistName)
+
+            if uri is not None:
+                self.artist_index.set(artistName, uri)
+
+        return None
+
+    @callback
+    def async_sync(self, account: str) -> asyncio.Task:
+        """Syncs the library of an account in the background. A sync
+        already running for the account is joined"""
+        task = self._sync_tasks.get(account)
+
+        if task is None:
+            task = self.hass.async_create_background_task(
+                self._async_sync(account), f"spotcast_library_sync_{account}"
+            )
+            self._sync_tasks[account] = task
+            task.add_done_callback(
+                lambda _: self._sync_tasks.pop(account, None)
+            )
+
+        return task
+
+    async def _async_sync_all(self, _now=None):
+        await asyncio.gather(
+            *(self.async_sync(account) for account in list(self._data))
+        )
+
+    async def _async_sync(self, account: str):
+        self._async_track_playlists(account)
+
+        try:
+            client = await self._async_get_client(account)
+            library = self._data.get(account, {})
+
+            albums = await self.hass.async_add_executor_job(
+                self._fetch_albums, client, library.get("albums", {})
+            )
+            artists = await self.hass.async_add_executor_job(
+                self._fetch_artists, client
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            # keep the previous index until the next sync
+            _LOGGER.warning("Failed to sync library of %s: %s", account, exc)
+            return
+
+        self._async_update(
+            account,
+            {
+                "playlists": self._get_playlists_coordinator(account).data,
+                "albums": albums,
+                "artists": artists,
+            },
+        )
+
+    @callback
+    def _async_track_playlists(self, account: str):
+        """Follows the playlists fetched by the shared playlists
+        coordinator of the account, which keeps polling them while the
+        index listens"""
+        if account in self._playlists_listeners:
+            return
+
+        coordinator = self._get_playlists_coordinator(account)
+
+        @callback
+        def playlists_updated():
+            if account in self._data:
+                self._async_update(account, {"playlists": coordinator.data})
+
+        self._playlists_listeners[account] = coordinator.async_add_listener(
+            playlists_updated
+        )
+
+        if coordinator.data is None:
+            self.hass.async_create_task(coordinator.async_refresh())
+
+    @callback
+    def _async_update(self, account: str, updates: dict[str, dict]):
+        """Replaces the items of the kinds that changed and saves the
+        library. Kinds without new items are left as they are"""
+        library = self._data.get(account, {})
+        changed = account not in self._data
+
+        for kind, items in updates.items():
+            if items is not None and items != library.get(kind):
+                library[kind] = items
+                self._names.pop((account, kind), None)
+                self._albums_by_artist.pop(account, None)
+                changed = True
+
+        if changed:
+            _LOGGER.debug(
+                "Indexed %s: %s",
+                account,
+                {kind: len(items) for kind, items in library.items()},
+            )
+            self._data[account] = library
+            self._store.async_delay_save(lambda: self._data, STORE_SAVE_DELAY)
+
+    @staticmethod
+    def _fetch_albums(
+        client: spotipy.Spotify, known: dict[str, list]
+    ) -> dict[str, list]:
+        """Pages through the saved albums. Returns None if the first page
+        only has known albums and the number of albums didn't change,
+        since new albums are listed first"""
+        albums = {}
+        offset = 0
+
+        while True:
+            page = client.current_user_saved_albums(
+                limit=LIBRARY_PAGE_SIZE, offset=offset
+            )
+
+            if (
+                offset == 0
+                and known
+                and page["total"] == len(known)
+                and all(item["album"]["uri"] in known for item in page["items"])
+            ):
+                return None
+
+            for item in page["items"]:
+                album = item["album"]
+                albums[album["uri"]] = [
+                    album["name"],
+                    album["artists"][0]["name"] if album["artists"] else "",
+                ]
+
+            offset += len(page["items"])
+
+            if page["next"] is None or not page["items"]:
+                return albums
+
+    @staticmethod
+    def _fetch_artists(client: spotipy.Spotify) -> dict[str, list]:
+        artists = {}
+        after = None
+
+        while True:
+            page = client.current_user_followed_artists(
+                limit=LIBRARY_PAGE_SIZE, after=after
+            )["artists"]
+
+            for artist in page["items"]:
+                artists[artist["uri"]] = [artist["name"]]
+
+            after = page["cursors"]["after"]
+
+            if page["next"] is None or after is None:
+                return artists
+
+    @callback
+    def _async_shutdown(self, _event=None):
+        if self._cancel_sync is not None:
+            self._cancel_sync()
+            self._cancel_sync = None
+
+        for remove_listener in self._playlists_listeners.values():
+            remove_listener()
+
+        self._playlists_listeners.clear()
@@ -0,0 +1,128 @@
+"""Module polling the Spotify player state once per account for all the
+websocket subscribers"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+import homeassistant.core as ha_core
+import spotipy
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+
+PLAYER_FAST_INTERVAL = 1
+PLAYER_SLOW_INTERVAL = 15
+PLAYER_BOOST_DURATION = 10
+
+
+def diff_player_state(old: dict, new: dict) -> dict:
+    """Provides the top level fields of the player state that changed.
+    Removed fields are set to None"""
+    changes = {key: value for key, value in new.items() if old.get(key) != value}
+    changes.update({key: None for key in old if key not in new})
+    return changes
+
+
+class PlayerPoller:
+    """Polls `me/player` for an account while it has subscribers and
+    pushes the changed fields to them. Polls every second while playing
+    or right after a command, and every `PLAYER_SLOW_INTERVAL` seconds
+    otherwise"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        account: str,
+        async_get_client: Callable[[str], Awaitable[spotipy.Spotify]],
+    ):
+        self.hass = hass
+        self.account = account
+        self._async_get_client = async_get_client
+        self._subscribers: set[Callable[[dict], None]] = set()
+        self._state: dict = None
+        self._boost_until = 0.0
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task = None
+
+    @callback
+    def async_subscribe(self, on_change: Callable[[dict], None]) -> Callable:
+        """Calls `on_change` with the whole player state, then with the
+        fields changed by each poll. Returns a callable to unsubscribe"""
+        self._subscribers.add(on_change)
+
+        if self._state is not None:
+            on_change(self._state)
+
+        if self._task is None or self._task.done():
+            self._task = self.hass.async_create_background_task(
+                self._async_run(), f"spotcast_player_{self.account}"
+            )
+
+        @callback
+        def unsubscribe():
+            self._subscribers.discard(on_change)
+
+            if not self._subscribers:
+                # stop polling without waiting for the next poll
+                self._wake.set()
+
+        return unsubscribe
+
+    @callback
+    def async_poke(self):
+        """Polls right away and quickly for a while, as the player state
+        is about to change"""
+        self._boost_until = time.monotonic() + PLAYER_BOOST_DURATION
+        self._wake.set()
+
+    async def _async_run(self):
+        _LOGGER.debug("Start polling player of %s", self.account)
+
+        while self._subscribers:
+            self._wake.clear()
+
+            try:
+                client = await self._async_get_client(self.account)
+                state = await self.hass.async_add_executor_job(
+                    client._get, "me/player"  # pylint: disable=W0212
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                # keep the last known state until the next poll
+                _LOGGER.debug("Failed to poll player of %s: %s", self.account, exc)
+            else:
+                self._async_update(state or {})
+
+            if (
+                self._state is not None and self._state.get("is_playing")
+            ) or time.monotonic() < self._boost_until:
+                interval = PLAYER_FAST_INTERVAL
+            else:
+                interval = PLAYER_SLOW_INTERVAL
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+        # the state goes stale once nobody listens
+        self._state = None
+        _LOGGER.debug("Stop polling player of %s", self.account)
+
+    @callback
+    def _async_update(self, state: dict):
+        if self._state is None:
+            changes = state
+        else:
+            changes = diff_player_state(self._state, state)
+
+            if not changes:
+                return
+
+        self._state = state
+
+        for on_change in list(self._subscribers):
+            on_change(changes)
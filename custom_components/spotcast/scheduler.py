@@ -0,0 +1,190 @@
+"""Module pacing the requests sent to the Spotify Web API"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+import spotipy
+from spotipy import SpotifyException
+
+from .error import RateLimitError
+from .helpers import get_retry_after
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+REQUEST_RATE = 10
+REQUEST_BURST = 20
+DEFAULT_RETRY_AFTER = 1
+MAX_RETRIES = 3
+
+# longer pauses fail right away instead of holding executor threads
+MAX_PAUSE = 10
+
+# 429 responses are left to the scheduler instead of urllib3
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class RequestScheduler:
+    """Paces the Spotify Web API requests of all the accounts. Each
+    account has a token bucket of `burst` requests refilled at `rate`
+    requests per second. A 429 response pauses every request for the
+    delay in `Retry-After`. While interactive requests wait, background
+    requests are held back. Blocks the calling thread, so requests must
+    run in the executor. To bound how long a thread is held, requests
+    fail with `RateLimitError` while a pause longer than `max_pause`
+    seconds is in progress."""
+
+    def __init__(
+        self,
+        rate: float = REQUEST_RATE,
+        burst: int = REQUEST_BURST,
+        max_retries: int = MAX_RETRIES,
+        max_pause: float = MAX_PAUSE,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_pause = max_pause
+        self.requests = 0
+        self.throttled = 0
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._blocked_until = 0.0
+        self._waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        self._condition = threading.Condition()
+
+    def acquire(self, account: str, priority: str = PRIORITY_INTERACTIVE):
+        """Waits until the account can send a request. Raises
+        `RateLimitError` if requests are paused for too long"""
+        with self._condition:
+            self._waiting[priority] += 1
+
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._blocked_until - now
+
+                    if wait > self.max_pause:
+                        raise RateLimitError(wait)
+
+                    if wait <= 0:
+                        if (
+                            priority == PRIORITY_BACKGROUND
+                            and self._waiting[PRIORITY_INTERACTIVE] > 0
+                        ):
+                            # woken up once the interactive requests left
+                            wait = None
+                        else:
+                            wait = self._take(account, now)
+
+                            if wait <= 0:
+                                self.requests += 1
+                                return
+
+                    self._condition.wait(wait)
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def _take(self, account: str, now: float) -> float:
+        """Takes a token from the account's bucket. Returns 0 on success
+        or the delay before a token is available"""
+        tokens, last = self._buckets.get(account, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        if tokens >= 1:
+            self._buckets[account] = (tokens - 1, now)
+            return 0
+
+        self._buckets[account] = (tokens, now)
+        return (1 - tokens) / self.rate
+
+    def throttle(self, retry_after: float):
+        """Pauses every request for `retry_after` seconds"""
+        with self._condition:
+            self.throttled += 1
+            self._blocked_until = max(
+                self._blocked_until, time.monotonic() + retry_after
+            )
+            # waiters check again whether the pause is too long
+            self._condition.notify_all()
+
+        _LOGGER.warning(
+            "Spotify rate limit reached, pausing requests for %s seconds",
+            retry_after,
+        )
+
+    def call(
+        self,
+        account: str,
+        priority: str,
+        func: Callable,
+        *args,
+        **kwargs,
+    ) -> Any:
+        """Sends a request once allowed, and sends it again when
+        throttled, up to `max_retries` times. Pauses longer than
+        `max_pause` are not waited for"""
+        attempt = 0
+
+        while True:
+            self.acquire(account, priority)
+
+            try:
+                return func(*args, **kwargs)
+            except SpotifyException as exc:
+                if exc.http_status != 429:
+                    raise
+
+                retry_after = get_retry_after(exc) or DEFAULT_RETRY_AFTER
+                self.throttle(retry_after)
+
+                if attempt >= self.max_retries or retry_after > self.max_pause:
+                    raise
+
+                attempt += 1
+
+    @property
+    def stats(self) -> dict:
+        """Provides the queue depth per priority and the throttle
+        counters"""
+        with self._condition:
+            return {
+                "queue_depth": dict(self._waiting),
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "paused_for": max(self._blocked_until - time.monotonic(), 0),
+            }
+
+
+class ScheduledSpotify(spotipy.Spotify):
+    """Spotipy client sending its requests through a `RequestScheduler`"""
+
+    def __init__(
+        self,
+        scheduler: RequestScheduler,
+        account: str,
+        priority: str = PRIORITY_INTERACTIVE,
+        **kwargs,
+    ):
+        kwargs.setdefault("status_forcelist", RETRY_STATUS_CODES)
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+        self.account = account
+        self.priority = priority
+
+    def _internal_call(self, method, url, payload, params):
+        return self.scheduler.call(
+            self.account,
+            self.priority,
+            super()._internal_call,
+            method,
+            url,
+            payload,
+            params,
+        )
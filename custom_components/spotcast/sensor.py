@@ -4,44 +4,52 @@ from __future__ import annotations
 import collections
 import json
 import logging
-from datetime import timedelta
 
 import homeassistant.core as ha_core
+from homeassistant.components.media_player import DOMAIN as MEDIA_PLAYER_DOMAIN
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.const import STATE_OK, STATE_UNKNOWN
+from homeassistant.core import Event, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.event import (
+    async_track_state_added_domain,
+    async_track_state_removed_domain,
+)
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.util import dt
 
-from .const import CONF_SPOTIFY_COUNTRY, DOMAIN
-from .helpers import get_cast_devices
+from .const import DOMAIN
+from .coordinator import PlaylistsCoordinator
+from .helpers import get_cast_entity_infos
 
 _LOGGER = logging.getLogger(__name__)
 
-SENSOR_SCAN_INTERVAL_SECS = 60
-SCAN_INTERVAL = timedelta(seconds=SENSOR_SCAN_INTERVAL_SECS)
 
-
-def setup_platform(
+async def async_setup_platform(
     hass: ha_core.HomeAssistant,
     config: collections.OrderedDict,
-    add_devices,
+    async_add_entities,
     discovery_info=None,
 ):
 
-    try:
-        country = config[CONF_SPOTIFY_COUNTRY]
-    except KeyError:
-        country = None
+    coordinator = hass.data[DOMAIN]["controller"].get_playlists_coordinator()
 
-    add_devices([ChromecastDevicesSensor(hass)])
-    add_devices([ChromecastPlaylistSensor(hass, country)])
+    async_add_entities([ChromecastDevicesSensor(hass)])
+    async_add_entities([ChromecastPlaylistSensor(hass, coordinator)])
 
 
 class ChromecastDevicesSensor(SensorEntity):
+    """Lists the cast devices. Updated when cast media players are added,
+    removed or changed instead of polling"""
+
+    _attr_should_poll = False
+
     def __init__(self, hass):
         self.hass = hass
         self._state = STATE_UNKNOWN
-        self._chromecast_devices = []
-        self._attributes = {"devices_json": [], "devices": [], "last_update": None}
+        self._devices: dict[str, dict] = {}
+        self._devices_json = None
+        self._last_update = None
         _LOGGER.debug("initiating sensor")
 
     @property
@@ -55,36 +63,104 @@ class ChromecastDevicesSensor(SensorEntity):
     @property
     def extra_state_attributes(self):
         """Return the state attributes."""
-        return self._attributes
+        devices = list(self._devices.values())
+
+        # only serialized again after the devices changed
+        if self._devices_json is None:
+            self._devices_json = json.dumps(devices, ensure_ascii=False)
 
-    def update(self):
+        return {
+            "devices_json": self._devices_json,
+            "devices": devices,
+            "last_update": self._last_update,
+        }
+
+    async def async_added_to_hass(self):
         _LOGGER.debug("Getting chromecast devices")
 
-        known_devices = get_cast_devices(self.hass)
-        _LOGGER.debug("sensor devices %s", known_devices)
-
-        chromecasts = [
-            {
-                "uuid": str(cast_info.cast_info.uuid),
-                "model_name": cast_info.cast_info.model_name,
-                "name": cast_info.cast_info.friendly_name,
-                "manufacturer": cast_info.cast_info.manufacturer,
-                "cast_type": cast_info.cast_info.cast_type,
-            }
-            for cast_info in known_devices
-        ]
-
-        self._attributes["devices_json"] = json.dumps(chromecasts, ensure_ascii=False)
-        self._attributes["devices"] = chromecasts
-        self._attributes["last_update"] = dt.now().isoformat("T")
+        for entity_id, cast_info in get_cast_entity_infos(self.hass).items():
+            self._devices[entity_id] = self._device_from_cast_info(cast_info)
+
+        self.async_on_remove(
+            async_track_state_added_domain(
+                self.hass, MEDIA_PLAYER_DOMAIN, self._async_state_changed
+            )
+        )
+        self.async_on_remove(
+            async_track_state_removed_domain(
+                self.hass, MEDIA_PLAYER_DOMAIN, self._async_state_changed
+            )
+        )
+        self.async_on_remove(
+            self.hass.bus.async_listen(
+                er.EVENT_ENTITY_REGISTRY_UPDATED,
+                self._async_registry_updated,
+                event_filter=_is_media_player_event,
+            )
+        )
+
+        self._async_devices_changed()
+
+    @staticmethod
+    def _device_from_cast_info(cast_info) -> dict:
+        return {
+            "uuid": str(cast_info.cast_info.uuid),
+            "model_name": cast_info.cast_info.model_name,
+            "name": cast_info.cast_info.friendly_name,
+            "manufacturer": cast_info.cast_info.manufacturer,
+            "cast_type": cast_info.cast_info.cast_type,
+        }
+
+    @callback
+    def _async_state_changed(self, event: Event):
+        if self._async_update_device(event.data["entity_id"]):
+            self._async_devices_changed()
+
+    @callback
+    def _async_registry_updated(self, event: Event):
+        # a renamed entity leaves its old entity id behind
+        old_entity_id = event.data.get("old_entity_id")
+        removed = self._devices.pop(old_entity_id, None) is not None
+
+        if self._async_update_device(event.data["entity_id"]) or removed:
+            self._async_devices_changed()
+
+    @callback
+    def _async_update_device(self, entity_id: str) -> bool:
+        """Updates the device of an entity in the table. Returns True if
+        it changed"""
+        cast_info = get_cast_entity_infos(self.hass, entity_id).get(entity_id)
+
+        if cast_info is None:
+            return self._devices.pop(entity_id, None) is not None
+
+        device = self._device_from_cast_info(cast_info)
+
+        if self._devices.get(entity_id) == device:
+            return False
+
+        self._devices[entity_id] = device
+        return True
+
+    @callback
+    def _async_devices_changed(self):
+        _LOGGER.debug("sensor devices %s", self._devices)
+        self._devices_json = None
+        self._last_update = dt.now().isoformat("T")
         self._state = STATE_OK
+        self.async_write_ha_state()
+
+
+@callback
+def _is_media_player_event(event_data) -> bool:
+    return event_data["entity_id"].startswith(f"{MEDIA_PLAYER_DOMAIN}.")
 
 
-class ChromecastPlaylistSensor(SensorEntity):
-    def __init__(self, hass: ha_core, country=None):
+class ChromecastPlaylistSensor(CoordinatorEntity[PlaylistsCoordinator], SensorEntity):
+    def __init__(self, hass: ha_core, coordinator: PlaylistsCoordinator):
+        super().__init__(coordinator)
         self.hass = hass
         self._state = STATE_UNKNOWN
-        self.country = country
         self._attributes = {"playlists": [], "last_update": None}
         _LOGGER.debug("initiating playlist sensor")
 
@@ -101,26 +177,31 @@ class ChromecastPlaylistSensor(SensorEntity):
         """Return the state attributes."""
         return self._attributes
 
-    def update(self):
-        _LOGGER.debug("Getting playlists")
+    async def async_added_to_hass(self):
+        await super().async_added_to_hass()
 
-        if self.country is not None:
-            country_code = self.country
+        if self.coordinator.data is None:
+            self.hass.async_create_task(self.coordinator.async_refresh())
         else:
-            # kept the country code to SE if not provided by the user for retrocompatibility
-            country_code = "SE"
-
-        playlist_type = "user"
-        locale = "en"
-        limit = 10
-        account = None
-
-        resp = self.hass.data[DOMAIN]["controller"].get_playlists(
-            account, playlist_type, country_code, locale, limit
-        )
-        self._attributes["playlists"] = [
-            {"uri": x["uri"], "name": x["name"]} for x in resp["items"]
-        ]
-
-        self._attributes["last_update"] = dt.now().isoformat("T")
+            self._handle_coordinator_update()
+
+    @callback
+    def _handle_coordinator_update(self):
+        """Called when the playlists changed or when updates start or
+        stop failing"""
+        if self.coordinator.data is None:
+            # no playlists yet, only the availability changed
+            super()._handle_coordinator_update()
+            return
+
+        _LOGGER.debug("Playlists updated")
+
+        self._attributes = {
+            "playlists": [
+                {"uri": uri, "name": name}
+                for uri, (name, _) in self.coordinator.data.items()
+            ],
+            "last_update": dt.now().isoformat("T"),
+        }
         self._state = STATE_OK
+        super()._handle_coordinator_update()
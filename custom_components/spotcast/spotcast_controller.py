@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 import collections
+import hashlib
 import json
 import logging
 import random
@@ -8,23 +10,72 @@ import time
 from asyncio import run_coroutine_threadsafe
 from collections import OrderedDict
 from datetime import datetime
+from functools import partial
+from typing import Callable, Coroutine
 
 import aiohttp
 import homeassistant.core as ha_core
-import pychromecast
 import spotipy
-from homeassistant.components.cast.helpers import ChromeCastZeroconf
+from spotipy import SpotifyException
+from homeassistant.core import Event, callback
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.event import (
+    async_call_later,
+    async_track_state_change_event,
+)
+from homeassistant.helpers.storage import Store
 from requests import TooManyRedirects
 from .spotify_controller import SpotifyController
+from .cache import TTLCache
+from .chromecast_pool import ChromecastPool, PooledChromecast
+from .coordinator import PlaylistsCoordinator
+from .player import PlayerPoller
 from .error import TokenError
-from .const import CONF_SP_DC, CONF_SP_KEY
-from .helpers import get_cast_devices, get_spotify_devices, get_spotify_media_player, query_from_url
+from .library import (
+    CONTEXT_SIZE_CACHE,
+    ArtistIndex,
+    CategoryPlaylistPools,
+    LibraryIndex,
+    get_context_size,
+    get_show_episode,
+)
+from .scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RequestScheduler,
+    ScheduledSpotify,
+)
+from .const import (
+    CONF_SP_DC,
+    CONF_SP_KEY,
+    DEFAULT_DEVICE_WAIT_TIMEOUT,
+    DEFAULT_TOKEN_REFRESH_MARGIN,
+    STORAGE_KEY_TOKENS,
+    STORAGE_VERSION,
+)
+from .helpers import (
+    SEARCH_CACHE,
+    TOP_TRACKS_CACHE,
+    async_get_spotify_devices,
+    get_cast_devices,
+    get_spotify_media_player,
+    query_from_url,
+)
 from .spotify_controller import SpotifyController
 from .crypto import get_totp
 
 _LOGGER = logging.getLogger(__name__)
 
+TOKEN_REFRESH_RETRY_DELAY = 60
+TOKEN_STORE_SAVE_DELAY = 1
+DEVICE_CACHE_TTL = 3600
+DEVICE_POLL_MIN_INTERVAL = 0.3
+DEVICE_POLL_MAX_INTERVAL = 2
+UNCONFIRMED_DEVICE_TTL = 60
+PLAYLISTS_CACHE_TTL = 30
+PLAYLISTS_PAGE_CONCURRENCY = 4
+
 
 class SpotifyCastDevice:
     """Represents a spotify device."""
@@ -34,10 +85,17 @@ class SpotifyCastDevice:
     spotifyController = None
 
     def __init__(
-        self, hass: ha_core.HomeAssistant, call_device_name: str, call_entity_id: str
+        self,
+        hass: ha_core.HomeAssistant,
+        call_device_name: str,
+        call_entity_id: str,
+        chromecast_pool: ChromecastPool,
+        account: str = None,
     ) -> None:
         """Initialize a spotify cast device."""
         self.hass = hass
+        self.chromecast_pool = chromecast_pool
+        self.account = account or "default"
 
         # Get device name from either device_name or entity_id
         device_name = None
@@ -58,12 +116,12 @@ class SpotifyCastDevice:
         if device_name is None or device_name.strip() == "":
             raise HomeAssistantError("device_name is empty")
 
-        # Find chromecast device
-        self.castDevice = self.get_chromecast_device(device_name)
+        # Find chromecast device, reusing its connection if possible
+        self.pooled = self.get_chromecast_device(device_name)
+        self.castDevice = self.pooled.cast
         _LOGGER.debug("Found cast device: %s", self.castDevice)
-        self.castDevice.wait()
 
-    def get_chromecast_device(self, device_name: str) -> None:
+    def get_chromecast_device(self, device_name: str) -> PooledChromecast:
         # Get cast from discovered devices of cast platform
         known_devices = get_cast_devices(self.hass)
 
@@ -78,9 +136,7 @@ class SpotifyCastDevice:
         )
         _LOGGER.debug("cast info: %s", cast_info)
         if cast_info:
-            return pychromecast.get_chromecast_from_cast_info(
-                cast_info.cast_info, ChromeCastZeroconf.get_zeroconf()
-            )
+            return self.chromecast_pool.get(cast_info)
         _LOGGER.error(
             "Could not find device %s from hass.data",
             device_name,
@@ -89,10 +145,45 @@ class SpotifyCastDevice:
             "Could not find device with name {}".format(device_name)
         )
 
-    def start_spotify_controller(self, access_token: str, expires: int):
-        sp = SpotifyController(self.castDevice, access_token, expires)
-        self.castDevice.register_handler(sp)
-        sp.launch_app()
+    async def async_start_spotify_controller(
+        self, access_token: str, expires: int
+    ):
+        # the controller is shared by all the casts to the chromecast, so
+        # a launch waits for the previous one and reuses its session
+        async with self.pooled.launch_lock:
+            await self._async_start_spotify_controller(access_token, expires)
+
+    async def _async_start_spotify_controller(
+        self, access_token: str, expires: int
+    ):
+        # a pooled chromecast keeps the controller registered by the
+        # previous cast
+        sp = self.pooled.spotify_controller
+
+        if sp is None:
+            sp = SpotifyController(
+                self.castDevice,
+                access_token,
+                expires,
+                hass=self.hass,
+                account=self.account,
+            )
+            self.castDevice.register_handler(sp)
+            self.pooled.spotify_controller = sp
+        elif sp.is_authenticated(self.account):
+            _LOGGER.debug(
+                "Spotify already running on %s for account %s, skipping launch",
+                self.castDevice.cast_info.friendly_name,
+                self.account,
+            )
+            self.spotifyController = sp
+            return
+        else:
+            sp.access_token = access_token
+            sp.expires = expires
+            sp.account = self.account
+
+        await sp.async_launch_app(self.hass.loop)
 
         if not sp.is_launched and not sp.credential_error:
             raise HomeAssistantError(
@@ -105,40 +196,72 @@ class SpotifyCastDevice:
 
         self.spotifyController = sp
 
-    def get_spotify_device_id(self, user_id) -> None:
+    async def async_get_spotify_device_id(
+        self,
+        user_id: str,
+        client: spotipy.Spotify,
+        timeout: float = DEFAULT_DEVICE_WAIT_TIMEOUT,
+    ) -> str:
+        """Waits for the device to appear in the Spotify Connect device
+        list. Returns as soon as either the spotify media player's
+        device coordinator or a short polling of `me/player/devices`
+        reports it"""
+        device_id = self.spotifyController.device
         spotify_media_player = get_spotify_media_player(self.hass, user_id)
-        max_retries = 5
-        counter = 0
+        devices_coordinator = spotify_media_player.devices
+        found = asyncio.Event()
+
+        _LOGGER.debug("Searching for Spotify device: %s", device_id)
+
+        @callback
+        def devices_updated():
+            if any(
+                device.device_id == device_id
+                for device in devices_coordinator.data or []
+            ):
+                found.set()
+
+        remove_listener = devices_coordinator.async_add_listener(devices_updated)
+        devices_updated()
+        self.hass.async_create_task(devices_coordinator.async_request_refresh())
+
+        deadline = time.monotonic() + timeout
+        interval = DEVICE_POLL_MIN_INTERVAL
         devices_available = None
-        _LOGGER.debug(
-            "Searching for Spotify device: {}".format(
-                self.spotifyController.device)
-        )
-        while counter < max_retries:
-            devices_available = get_spotify_devices(
-                spotify_media_player,
-                self.hass
-            )
-            # Look for device to make sure we can start playback
-            for device in devices_available:
-                if device.device_id == self.spotifyController.device:
-                    _LOGGER.debug(
-                        "Found matching Spotify device: {}".format(device)
-                    )
-                    return device.device_id
 
-            sleep = random.uniform(1.5, 1.8) ** counter
-            time.sleep(sleep)
-            counter = counter + 1
+        try:
+            while not found.is_set():
+                devices_available = await self.hass.async_add_executor_job(
+                    client.devices
+                )
 
-        _LOGGER.error(
-            'No device with id "{}" known by Spotify'.format(
-                self.spotifyController.device
-            )
-        )
-        _LOGGER.error("Known devices: {}".format(devices_available))
+                if any(
+                    device["id"] == device_id
+                    for device in devices_available.get("devices", [])
+                ):
+                    break
 
-        raise HomeAssistantError("Failed to get device id from Spotify")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    _LOGGER.error(
+                        'No device with id "%s" known by Spotify', device_id
+                    )
+                    _LOGGER.error("Known devices: %s", devices_available)
+                    raise HomeAssistantError(
+                        "Failed to get device id from Spotify"
+                    )
+
+                try:
+                    await asyncio.wait_for(
+                        found.wait(), min(interval, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    interval = min(interval * 1.5, DEVICE_POLL_MAX_INTERVAL)
+        finally:
+            remove_listener()
+
+        _LOGGER.debug("Found matching Spotify device: %s", device_id)
+        return device_id
 
 
 class SpotifyToken:
@@ -150,16 +273,27 @@ class SpotifyToken:
     _access_token = None
     _token_expires = 0
 
-    def __init__(self, hass: ha_core.HomeAssistant, sp_dc: str, sp_key: str):
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        sp_dc: str,
+        sp_key: str,
+        refresh_margin: int = DEFAULT_TOKEN_REFRESH_MARGIN,
+        on_refresh: Callable[[SpotifyToken], None] = None,
+    ):
         self.hass = hass
         self.sp_dc = sp_dc
         self.sp_key = sp_key
         self.totp = get_totp()
+        self.refresh_margin = refresh_margin
+        self._on_refresh = on_refresh
+        self._cancel_refresh = None
+        self._refresh_task = None
 
     def ensure_token_valid(self) -> bool:
         if float(self._token_expires) > time.time():
             return True
-        self.get_spotify_token()
+        self.get_token()
 
     @property
     def access_token(self) -> str:
@@ -167,13 +301,96 @@ class SpotifyToken:
         _LOGGER.debug("expires: %s time: %s", self._token_expires, time.time())
         return self._access_token
 
-    def get_spotify_token(self) -> tuple[str, int]:
+    @property
+    def expires(self) -> int:
+        """Expiration timestamp of the current access token, in seconds"""
+        return int(self._token_expires)
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the cookies used to generate the access token, so
+        a token saved with outdated cookies is never restored"""
+        return hashlib.sha256(f"{self.sp_dc}:{self.sp_key}".encode()).hexdigest()
+
+    def restore(self, access_token: str, expires: int) -> bool:
+        """Reuses a previously saved access token if it is still valid.
+        Returns False if the token is expired or too close to expiring"""
+        if float(expires) - self.refresh_margin <= time.time():
+            return False
+
+        self._access_token = access_token
+        self._token_expires = expires
+        return True
+
+    @callback
+    def async_schedule_refresh(self, delay: float = None):
+        """Schedules a background refresh of the token, by default
+        `refresh_margin` seconds before it expires"""
+        if self._cancel_refresh is not None:
+            self._cancel_refresh()
+
+        if delay is None:
+            delay = float(self._token_expires) - self.refresh_margin - time.time()
+
+        self._cancel_refresh = async_call_later(
+            self.hass, max(delay, 0), self._async_scheduled_refresh
+        )
+
+    async def _async_scheduled_refresh(self, _now):
+        self._cancel_refresh = None
+
         try:
-            self._access_token, self._token_expires = run_coroutine_threadsafe(
-                self.start_session(), self.hass.loop
-            ).result()
-            expires = self._token_expires - int(time.time())
-            return self._access_token, expires
+            await self.async_refresh()
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.warning(
+                "Background refresh of spotify token failed, retrying in "
+                "%i seconds: %s",
+                TOKEN_REFRESH_RETRY_DELAY,
+                exc,
+            )
+            self.async_schedule_refresh(TOKEN_REFRESH_RETRY_DELAY)
+
+    async def async_refresh(self) -> tuple[str, int]:
+        """Gets a new access token and schedules its next refresh. A
+        refresh already in flight is joined instead of starting a new
+        session"""
+        if self._refresh_task is None:
+            self._refresh_task = self.hass.async_create_task(
+                self._async_fetch_token()
+            )
+            self._refresh_task.add_done_callback(self._clear_refresh_task)
+
+        return await asyncio.shield(self._refresh_task)
+
+    @callback
+    def _clear_refresh_task(self, _task: asyncio.Task):
+        self._refresh_task = None
+
+    async def _async_fetch_token(self) -> tuple[str, int]:
+        self._access_token, self._token_expires = await self.start_session()
+        self.async_schedule_refresh()
+
+        if self._on_refresh is not None:
+            self._on_refresh(self)
+
+        return self._access_token, self._token_expires
+
+    async def async_get_token(self) -> tuple[str, int]:
+        """Provides a valid access token and the number of seconds
+        before it expires. Only refreshes the token if it is expired"""
+        if float(self._token_expires) <= time.time():
+            await self.async_refresh()
+
+        return self._access_token, self._token_expires - int(time.time())
+
+    def get_token(self) -> tuple[str, int]:
+        """Thread safe version of `async_get_token`. Callers from
+        multiple threads share the same in-flight refresh"""
+        return self._run_threadsafe(self.async_get_token())
+
+    def _run_threadsafe(self, coro: Coroutine) -> tuple[str, int]:
+        try:
+            return run_coroutine_threadsafe(coro, self.hass.loop).result()
         except TooManyRedirects:
             _LOGGER.error(
                 "Could not get spotify token. sp_dc and sp_key could be "
@@ -297,12 +514,91 @@ class SpotcastController:
         sp_dc: str,
         sp_key: str,
         accs: collections.OrderedDict,
+        token_refresh_margin: int = DEFAULT_TOKEN_REFRESH_MARGIN,
+        device_wait_timeout: int = DEFAULT_DEVICE_WAIT_TIMEOUT,
+        trust_cast_device_id: bool = False,
     ) -> None:
         if accs:
             self.accounts = accs
         self.accounts["default"] = OrderedDict(
             [("sp_dc", sp_dc), ("sp_key", sp_key)])
         self.hass = hass
+        self.token_refresh_margin = token_refresh_margin
+        self.device_wait_timeout = device_wait_timeout
+        self.trust_cast_device_id = trust_cast_device_id
+        self._unconfirmed_devices = TTLCache(
+            maxsize=16, ttl=UNCONFIRMED_DEVICE_TTL
+        )
+        self.scheduler = RequestScheduler()
+        self._spotify_clients: dict[tuple[str, str], spotipy.Spotify] = {}
+        self._device_cache = TTLCache(maxsize=64, ttl=DEVICE_CACHE_TTL)
+        self._device_listeners: dict[str, Callable] = {}
+        self._entity_listeners: dict[str, Callable] = {}
+        self._registry_listener = None
+        self.chromecast_pool = ChromecastPool(hass)
+        self.artist_index = ArtistIndex(hass)
+        self.category_pools = CategoryPlaylistPools(
+            hass,
+            partial(self.async_get_spotify_client, priority=PRIORITY_BACKGROUND),
+        )
+        self.library_index = LibraryIndex(
+            hass,
+            partial(self.async_get_spotify_client, priority=PRIORITY_BACKGROUND),
+            self.get_playlists_coordinator,
+            self.artist_index,
+        )
+        self._playlists_coordinators: dict[str, PlaylistsCoordinator] = {}
+        self._player_pollers: dict[str, PlayerPoller] = {}
+        self._playlists_cache = TTLCache(maxsize=64, ttl=PLAYLISTS_CACHE_TTL)
+        self._playlists_requests: dict[tuple, asyncio.Task] = {}
+        self._token_store = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY_TOKENS, private=True
+        )
+
+    async def async_load_tokens(self):
+        """Restores the tokens saved by a previous run. Accounts without
+        a valid saved token get one in the background"""
+        data = await self._token_store.async_load() or {}
+
+        for account in self.accounts:
+            token = self.get_token_instance(account)
+            saved = data.get(account, {})
+
+            if saved.get("fingerprint") == token.fingerprint and token.restore(
+                saved["access_token"], saved["expires"]
+            ):
+                _LOGGER.debug("Restored saved token for account %s", account)
+                token.async_schedule_refresh()
+                continue
+
+            token.async_schedule_refresh(0)
+
+    @callback
+    def _async_token_refreshed(self, token: SpotifyToken):
+        """Swaps the new access token into the account's clients and
+        saves it"""
+        for (account, _), client in list(self._spotify_clients.items()):
+            if self.spotifyTokenInstances.get(account) is token:
+                client.set_auth(token._access_token)
+
+        self._async_save_tokens()
+
+    @callback
+    def _async_save_tokens(self):
+        self._token_store.async_delay_save(
+            self._tokens_to_store, TOKEN_STORE_SAVE_DELAY
+        )
+
+    def _tokens_to_store(self) -> dict:
+        return {
+            account: {
+                "fingerprint": token.fingerprint,
+                "access_token": token._access_token,
+                "expires": token.expires,
+            }
+            for account, token in self.spotifyTokenInstances.items()
+            if token._access_token is not None
+        }
 
     def get_token_instance(self, account: str = None) -> any:
         """Get token instance for account"""
@@ -317,48 +613,254 @@ class SpotcastController:
         _LOGGER.debug("setting up with  account %s", account)
         if account not in self.spotifyTokenInstances:
             self.spotifyTokenInstances[account] = SpotifyToken(
-                self.hass, dc, key)
+                self.hass,
+                dc,
+                key,
+                refresh_margin=self.token_refresh_margin,
+                on_refresh=self._async_token_refreshed,
+            )
         return self.spotifyTokenInstances[account]
 
-    def get_spotify_client(self, account: str) -> spotipy.Spotify:
-        return spotipy.Spotify(auth=self.get_token_instance(account).access_token)
+    def get_spotify_client(
+        self, account: str, priority: str = PRIORITY_INTERACTIVE
+    ) -> spotipy.Spotify:
+        access_token = self.get_token_instance(account).access_token
+        return self._get_pooled_client(account, access_token, priority)
+
+    async def async_get_spotify_client(
+        self, account: str, priority: str = PRIORITY_INTERACTIVE
+    ) -> spotipy.Spotify:
+        access_token, _ = await self.get_token_instance(account).async_get_token()
+        return self._get_pooled_client(account, access_token, priority)
+
+    def _get_pooled_client(
+        self,
+        account: str,
+        access_token: str,
+        priority: str = PRIORITY_INTERACTIVE,
+    ) -> spotipy.Spotify:
+        """Provides the long lived client of an account, so its
+        keep-alive connections are reused between requests. Each
+        priority has its own client, all paced by the same scheduler"""
+        if account is None:
+            account = "default"
+
+        client = self._spotify_clients.get((account, priority))
+
+        if client is None:
+            client = self._spotify_clients.setdefault(
+                (account, priority),
+                ScheduledSpotify(
+                    self.scheduler, account, priority, auth=access_token
+                ),
+            )
+
+        return client
+
+    @callback
+    def get_playlists_coordinator(self, account: str = None) -> PlaylistsCoordinator:
+        """Provides the coordinator of the playlists of an account, shared
+        by all its users"""
+        if account is None:
+            account = "default"
 
-    def _getSpotifyConnectDeviceId(self, client, device_name):
-        media_player = get_spotify_media_player(
-            self.hass, client._get("me")["id"])
-        devices_available = get_spotify_devices(media_player, self.hass)
+        if account not in self._playlists_coordinators:
+            self._playlists_coordinators[account] = PlaylistsCoordinator(
+                self.hass,
+                account,
+                partial(self.async_get_spotify_client, priority=PRIORITY_BACKGROUND),
+            )
+
+        return self._playlists_coordinators[account]
+
+    @callback
+    def get_player_poller(self, account: str = None) -> PlayerPoller:
+        """Provides the poller of the player state of an account, shared
+        by all its subscribers"""
+        if account is None:
+            account = "default"
+
+        if account not in self._player_pollers:
+            self._player_pollers[account] = PlayerPoller(
+                self.hass,
+                account,
+                partial(self.async_get_spotify_client, priority=PRIORITY_BACKGROUND),
+            )
+
+        return self._player_pollers[account]
+
+    @property
+    def stats(self) -> dict:
+        """Provides the counters of the request scheduler and caches"""
+        return {
+            "scheduler": self.scheduler.stats,
+            "search_cache": SEARCH_CACHE.stats,
+            "top_tracks_cache": TOP_TRACKS_CACHE.stats,
+            "context_size_cache": CONTEXT_SIZE_CACHE.stats,
+            "playlists_cache": self._playlists_cache.stats,
+        }
+
+    async def _async_get_spotify_connect_device_id(
+        self, media_player, device_name
+    ):
+        devices_available = await async_get_spotify_devices(media_player)
         for device in devices_available:
             if device.name == device_name:
                 return device.device_id
         return None
 
-    def get_spotify_device_id(self, account, spotify_device_id, device_name, entity_id):
+    async def async_get_spotify_device_id(
+        self, account, spotify_device_id, device_name, entity_id
+    ):
+        # first, rely on spotify id given in config
+        if spotify_device_id:
+            return spotify_device_id
+
+        cache_key = (account or "default", device_name or entity_id)
+        spotify_device_id = self._device_cache.get(cache_key)
+
+        if spotify_device_id is not None:
+            _LOGGER.debug(
+                "Using cached spotify device id %s for %s",
+                spotify_device_id,
+                cache_key[1],
+            )
+            return spotify_device_id
+
         # login as real browser to get powerful token
-        access_token, expires = self.get_token_instance(
-            account).get_spotify_token()
+        access_token, expires = await self.get_token_instance(
+            account).async_get_token()
         # get the spotify web api client
-        client = spotipy.Spotify(auth=access_token)
-        # first, rely on spotify id given in config
-        if not spotify_device_id:
-            # if not present, check if there's a spotify connect device
-            # with that name
-            spotify_device_id = self._getSpotifyConnectDeviceId(
-                client, device_name)
+        client = self._get_pooled_client(account, access_token)
+        me_resp = await self.hass.async_add_executor_job(client._get, "me")
+        media_player = get_spotify_media_player(self.hass, me_resp["id"])
+
+        # check if there's a spotify connect device with that name
+        spotify_device_id = await self._async_get_spotify_connect_device_id(
+            media_player, device_name)
         if not spotify_device_id:
             # if still no id available, check cast devices and launch
             # the app on chromecast
-            spotify_cast_device = SpotifyCastDevice(
+            spotify_cast_device = await self.hass.async_add_executor_job(
+                SpotifyCastDevice,
                 self.hass,
                 device_name,
                 entity_id,
+                self.chromecast_pool,
+                account,
+            )
+            await spotify_cast_device.async_start_spotify_controller(
+                access_token, expires
             )
-            me_resp = client._get("me")
-            spotify_cast_device.start_spotify_controller(access_token, expires)
-            # Make sure it is started
-            spotify_device_id = spotify_cast_device.get_spotify_device_id(
-                me_resp["id"])
+
+            if self.trust_cast_device_id:
+                # the app accepted the id we gave it, playback can start
+                # before spotify lists the device
+                spotify_device_id = spotify_cast_device.spotifyController.device
+                self._unconfirmed_devices.set(
+                    spotify_device_id, (spotify_cast_device, me_resp["id"], client)
+                )
+            else:
+                # Make sure it is started
+                spotify_device_id = (
+                    await spotify_cast_device.async_get_spotify_device_id(
+                        me_resp["id"], client, self.device_wait_timeout)
+                )
+
+        self._device_cache.set(cache_key, spotify_device_id)
+        self._async_track_device_changes(cache_key[0], media_player, entity_id)
         return spotify_device_id
 
+    async def async_confirm_spotify_device(self, spotify_device_id: str) -> bool:
+        """Waits for a device id trusted right after launch to appear in
+        the spotify device list. Returns False if the device id wasn't
+        pending confirmation"""
+        pending = self._unconfirmed_devices.pop(spotify_device_id)
+
+        if pending is None:
+            return False
+
+        spotify_cast_device, user_id, client = pending
+        await spotify_cast_device.async_get_spotify_device_id(
+            user_id, client, self.device_wait_timeout
+        )
+        return True
+
+    @callback
+    def invalidate_spotify_device_id(self, account, device_name, entity_id):
+        """Forgets the spotify device id resolved for a device, and the
+        Spotify session of its chromecast so the app is launched again"""
+        spotify_device_id = self._device_cache.pop(
+            (account or "default", device_name or entity_id)
+        )
+
+        if spotify_device_id is not None:
+            self.chromecast_pool.reset_sessions(spotify_device_id)
+
+    @callback
+    def _async_track_device_changes(
+        self, account: str, media_player, entity_id: str = None
+    ):
+        """Invalidates the cached device ids of an account when they
+        leave the spotify device list, or when the cast entity they
+        were resolved from changes"""
+
+        @callback
+        def devices_updated():
+            devices = media_player.devices.data
+
+            if devices is None:
+                return
+
+            known_ids = {device.device_id for device in devices}
+            removed = self._device_cache.invalidate(
+                lambda key, value: key[0] == account and value not in known_ids
+            )
+
+            if removed:
+                _LOGGER.debug(
+                    "Removed %i devices of %s from device cache", removed, account
+                )
+
+        if account not in self._device_listeners:
+            self._device_listeners[account] = (
+                media_player.devices.async_add_listener(devices_updated)
+            )
+
+        @callback
+        def entity_changed(event: Event):
+            old_state = event.data["old_state"]
+            new_state = event.data["new_state"]
+
+            if (
+                old_state is None
+                or new_state is None
+                or old_state.name != new_state.name
+            ):
+                self._device_cache.invalidate(
+                    lambda key, _: key[1] == event.data["entity_id"]
+                )
+
+        if entity_id is not None and entity_id not in self._entity_listeners:
+            self._entity_listeners[entity_id] = async_track_state_change_event(
+                self.hass, entity_id, entity_changed
+            )
+
+        if self._registry_listener is None:
+            self._registry_listener = self.hass.bus.async_listen(
+                er.EVENT_ENTITY_REGISTRY_UPDATED, self._async_registry_updated
+            )
+
+    @callback
+    def _async_registry_updated(self, event: Event):
+        """Invalidates the devices resolved from a removed or renamed
+        entity"""
+        if event.data["action"] == "create":
+            return
+
+        entity_ids = {event.data["entity_id"], event.data.get("old_entity_id")}
+        self._device_cache.invalidate(lambda key, _: key[1] in entity_ids)
+
     def play(
         self,
         client: spotipy.Spotify,
@@ -369,7 +871,9 @@ class SpotcastController:
         ignore_fully_played: str,
         position_ms: str,
         country_code: str = None
-    ) -> None:
+    ) -> str:
+        """Starts the playback of an uri and returns the uri actually
+        played (e.g. the episode chosen for a show)"""
         _LOGGER.debug(
             "Playing URI: %s on device-id: %s",
             uri,
@@ -377,26 +881,23 @@ class SpotcastController:
         )
 
         if uri.find("show") > 0:
-            show_episodes_info = client.show_episodes(uri, market=country_code)
-            if show_episodes_info and len(show_episodes_info["items"]) > 0:
-                if ignore_fully_played:
-                    for episode in show_episodes_info["items"]:
-                        if not episode["resume_point"]["fully_played"]:
-                            episode_uri = episode["external_urls"]["spotify"]
-                            break
-                else:
-                    episode_uri = show_episodes_info["items"][0]["external_urls"][
-                        "spotify"
-                    ]
-                _LOGGER.debug(
-                    (
-                        "Playing episode using uris (latest podcast playlist)="
-                        " for uri: %s"
-                    ),
-                    episode_uri,
-                )
-                client.start_playback(
-                    device_id=spotify_device_id, uris=[episode_uri], position_ms=position_ms)
+            episode = get_show_episode(
+                client, uri, country_code, bool(ignore_fully_played)
+            )
+            if episode is None:
+                raise HomeAssistantError(f"No episode to play in show {uri}")
+
+            episode_uri = episode["external_urls"]["spotify"]
+            _LOGGER.debug(
+                (
+                    "Playing episode using uris (latest podcast playlist)="
+                    " for uri: %s"
+                ),
+                episode_uri,
+            )
+            client.start_playback(
+                device_id=spotify_device_id, uris=[episode_uri], position_ms=position_ms)
+            uri = episode_uri
         elif uri.find("episode") > 0:
             _LOGGER.debug("Playing episode using uris= for uri: %s", uri)
             client.start_playback(device_id=spotify_device_id, uris=[
@@ -418,16 +919,19 @@ class SpotcastController:
             kwargs = {"device_id": spotify_device_id,
                       "context_uri": uri, "position_ms": position_ms}
 
+            sized_context = (
+                uri.find("album") > 0
+                or uri.find("playlist") > 0
+                or uri.find("collection") > 0
+            )
+            size_cached = False
+
             if random_song:
-                if uri.find("album") > 0:
-                    results = client.album_tracks(uri, market=country_code)
-                    position = random.randint(0, int(results["total"]) - 1)
-                elif uri.find("playlist") > 0:
-                    results = client.playlist_tracks(uri)
-                    position = random.randint(0, int(results["total"]) - 1)
-                elif uri.find("collection") > 0:
-                    results = client.current_user_saved_tracks()
-                    position = random.randint(0, int(results["total"]) - 1)
+                if sized_context:
+                    total, size_cached = get_context_size(
+                        client, uri, country_code
+                    )
+                    position = random.randint(0, total - 1)
                 _LOGGER.debug(
                     "Start playback at random position: %s", position)
             if uri.find("artist") < 1:
@@ -440,7 +944,27 @@ class SpotcastController:
                 uri,
                 random_song,
             )
-            client.start_playback(**kwargs)
+
+            try:
+                client.start_playback(**kwargs)
+            except SpotifyException as exc:
+                # a cached size may be past the end of a context that
+                # shrank since, pick a position within its current size
+                if exc.http_status != 400 or not random_song or not size_cached:
+                    raise
+
+                total, _ = get_context_size(
+                    client, uri, country_code, use_cache=False
+                )
+                kwargs["offset"] = {"position": random.randint(0, total - 1)}
+                _LOGGER.debug(
+                    "Outdated size of %s, starting at position %s instead",
+                    uri,
+                    kwargs["offset"]["position"],
+                )
+                client.start_playback(**kwargs)
+
+        return uri
 
     def get_playlists(
         self,
@@ -449,15 +973,17 @@ class SpotcastController:
         country_code: str,
         locale: str,
         limit: int,
+        priority: str = PRIORITY_INTERACTIVE,
+        offset: int = 0,
     ) -> dict:
-        client = self.get_spotify_client(account)
+        client = self.get_spotify_client(account, priority)
         resp = {}
 
         if playlist_type == "discover-weekly":
             playlist_type = "made-for-x"
 
         if playlist_type == "user" or playlist_type == "default" or playlist_type == "":
-            resp = client.current_user_playlists(limit=limit)
+            resp = client.current_user_playlists(limit=limit, offset=offset)
 
         elif playlist_type == "featured":
             resp = client.featured_playlists(
@@ -465,7 +991,7 @@ class SpotcastController:
                 country=country_code,
                 timestamp=datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
                 limit=limit,
-                offset=0,
+                offset=offset,
             )
             resp = resp.get("playlists")
         else:
@@ -476,8 +1002,95 @@ class SpotcastController:
                 platform="web",
                 types="album,playlist,artist,show,station",
                 limit=limit,
-                offset=0,
+                offset=offset,
             )
             resp = resp.get("content")
 
         return resp
+
+    async def async_get_playlists(
+        self,
+        account: str,
+        playlist_type: str,
+        country_code: str,
+        locale: str,
+        limit: int,
+        force_refresh: bool = False,
+    ) -> dict:
+        """Async version of `get_playlists`. Identical requests in flight
+        share the same call, and responses are reused for
+        `PLAYLISTS_CACHE_TTL` seconds unless `force_refresh` is set"""
+        key = (account or "default", playlist_type, country_code, locale, limit)
+
+        if not force_refresh:
+            resp = self._playlists_cache.get(key)
+
+            if resp is not None:
+                return resp
+
+        task = self._playlists_requests.get(key)
+
+        if task is None:
+            task = self.hass.async_create_task(self._async_fetch_playlists(key))
+            self._playlists_requests[key] = task
+            task.add_done_callback(
+                lambda _: self._playlists_requests.pop(key, None)
+            )
+
+        return await asyncio.shield(task)
+
+    async def _async_fetch_playlists(self, key: tuple) -> dict:
+        resp = await self.hass.async_add_executor_job(self.get_playlists, *key)
+        self._playlists_cache.set(key, resp)
+        return resp
+
+    async def async_stream_playlists(
+        self,
+        account: str,
+        playlist_type: str,
+        country_code: str,
+        locale: str,
+        page_size: int,
+        on_page: Callable[[int, dict], None],
+        concurrency: int = PLAYLISTS_PAGE_CONCURRENCY,
+    ) -> int:
+        """Fetches every page of playlists, at most `concurrency` pages at
+        a time, and calls `on_page` with the offset and content of each
+        page as soon as it arrives. Pages after the first one can arrive
+        in any order. Returns the total number of playlists"""
+        fetch_page = partial(
+            self.get_playlists,
+            account,
+            playlist_type,
+            country_code,
+            locale,
+            page_size,
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def async_fetch_page(offset: int) -> tuple[int, dict]:
+            async with semaphore:
+                resp = await self.hass.async_add_executor_job(
+                    partial(fetch_page, offset=offset)
+                )
+            return offset, resp
+
+        _, first_page = await async_fetch_page(0)
+        on_page(0, first_page)
+        total = first_page.get("total", len(first_page.get("items", [])))
+
+        tasks = [
+            self.hass.async_create_task(async_fetch_page(offset))
+            for offset in range(page_size, total, page_size)
+        ]
+
+        try:
+            for request in asyncio.as_completed(tasks):
+                offset, resp = await request
+                on_page(offset, resp)
+        finally:
+            # stop fetching once the subscriber is gone
+            for task in tasks:
+                task.cancel()
+
+        return total
@@ -3,20 +3,24 @@ Controller to interface with Spotify.
 """
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import json
 import logging
 import threading
-import requests
+import time
+from functools import partial
 import json
 import hashlib
 
 from .const import APP_SPOTIFY
 from .error import LaunchError
 
-import requests
+import homeassistant.core as ha_core
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from pychromecast.controllers import BaseController
 
+from .cache import TTLCache
 from .const import APP_SPOTIFY
 
 APP_NAMESPACE = "urn:x-cast:com.spotify.chromecast.secure.v1"
@@ -26,12 +30,27 @@ TYPE_ADD_USER = "addUser"
 TYPE_ADD_USER_RESPONSE = "addUserResponse"
 TYPE_ADD_USER_ERROR = "addUserError"
 
+DEVICE_AUTH_URL = "https://spclient.wg.spotify.com/device-auth/v1/refresh"
+DEVICE_AUTH_EXPIRY_MARGIN = 60
+SESSION_EXPIRY_MARGIN = 60
+
+# device-auth tokens per (clientID, deviceId, account), shared by all
+# the chromecasts
+DEVICE_AUTH_CACHE = TTLCache(maxsize=32)
+
 
 # pylint: disable=too-many-instance-attributes
 class SpotifyController(BaseController):
     """Controller to interact with Spotify namespace."""
 
-    def __init__(self, castDevice, access_token=None, expires=None):
+    def __init__(
+        self,
+        castDevice,
+        access_token=None,
+        expires=None,
+        hass: ha_core.HomeAssistant = None,
+        account: str = None,
+    ):
         super(SpotifyController, self).__init__(APP_NAMESPACE, APP_SPOTIFY)
 
         self.logger = logging.getLogger(__name__)
@@ -43,6 +62,16 @@ class SpotifyController(BaseController):
         self.credential_error = False
         self.waiting = threading.Event()
         self.castDevice = castDevice
+        self.hass = hass
+        self.account = account
+        self._device_auth_key = None
+        self.session_id = None
+        self.authenticated_account = None
+        self.authenticated_until = 0
+        self.timings = {}
+        self._phase_start = {}
+        self._loop = None
+        self._launched = None
 
     def receive_message(self, _message, data: dict):
         """
@@ -51,56 +80,163 @@ class SpotifyController(BaseController):
         Called when a message is received.
         """
         if data["type"] == TYPE_GET_INFO_RESPONSE:
+            self._end_phase("get_info")
             self.device = self.getSpotifyDeviceID()
             self.client = data["payload"]["clientID"]
-            headers = {
-                "authority": "spclient.wg.spotify.com",
-                "authorization": "Bearer {}".format(self.access_token),
-                "content-type": "text/plain;charset=UTF-8",
-            }
-
-            request_body = json.dumps(
-                {"clientId": self.client, "deviceId": self.device}
-            )
 
-            response = requests.post(
-                "https://spclient.wg.spotify.com/device-auth/v1/refresh",
-                headers=headers,
-                data=request_body,
-            )
-            json_resp = response.json()
-            self.send_message(
-                {
-                    "type": TYPE_ADD_USER,
-                    "payload": {
-                        "blob": json_resp["accessToken"],
-                        "tokenType": "accesstoken",
-                    },
-                }
+            # the device-auth exchange must not block the socket thread
+            asyncio.run_coroutine_threadsafe(
+                self._async_add_user(self.client, self.device), self.hass.loop
             )
+
         if data["type"] == TYPE_ADD_USER_RESPONSE:
             self.is_launched = True
-            self.waiting.set()
+            self._record_session()
+            self._launch_done()
 
         if data["type"] == TYPE_ADD_USER_ERROR:
+            # a cached device-auth token may have been revoked
+            if self._device_auth_key is not None:
+                DEVICE_AUTH_CACHE.pop(self._device_auth_key)
             self.device = None
             self.credential_error = True
-            self.waiting.set()
+            self._launch_done()
         return True
 
-    def launch_app(self, timeout=10):
-        """
-        Launch Spotify application.
+    async def _async_add_user(self, client_id: str, device_id: str):
+        """Gets a device-auth token for the chromecast, reusing a cached
+        one if still valid, and sends it to the Spotify app"""
+        self._device_auth_key = (client_id, device_id, self.account)
+        blob = DEVICE_AUTH_CACHE.get(self._device_auth_key)
 
-        Will raise a LaunchError exception if there is no response from the
-        Spotify app within timeout seconds.
-        """
+        try:
+            if blob is None:
+                blob = await self._async_refresh_device_auth(client_id, device_id)
+            else:
+                self.logger.debug("Reusing cached device-auth token")
+
+            self._start_phase("add_user")
+            await self.hass.async_add_executor_job(
+                self.send_message,
+                {
+                    "type": TYPE_ADD_USER,
+                    "payload": {
+                        "blob": blob,
+                        "tokenType": "accesstoken",
+                    },
+                },
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            self.logger.error("Failed to authenticate the Spotify app: %s", exc)
+            self.credential_error = True
+            self._launch_done()
+
+    async def _async_refresh_device_auth(
+        self, client_id: str, device_id: str
+    ) -> str:
+        headers = {
+            "authority": "spclient.wg.spotify.com",
+            "authorization": "Bearer {}".format(self.access_token),
+            "content-type": "text/plain;charset=UTF-8",
+        }
+
+        request_body = json.dumps(
+            {"clientId": client_id, "deviceId": device_id}
+        )
+
+        self._start_phase("device_auth")
+        session = async_get_clientsession(self.hass)
+        async with session.post(
+            DEVICE_AUTH_URL,
+            headers=headers,
+            data=request_body,
+        ) as response:
+            response.raise_for_status()
+            json_resp = await response.json(content_type=None)
+        self._end_phase("device_auth")
+
+        # valid as long as spotify says, or as long as the access token
+        # used to get it
+        expires_in = json_resp.get("expiresIn", self.expires)
+        DEVICE_AUTH_CACHE.set(
+            self._device_auth_key,
+            json_resp["accessToken"],
+            ttl=max(float(expires_in) - DEVICE_AUTH_EXPIRY_MARGIN, 0),
+        )
+
+        return json_resp["accessToken"]
+
+    def _record_session(self):
+        """Remembers which receiver session the account was added to and
+        until when its token is valid"""
+        status = self.castDevice.status
+        self.session_id = status.session_id if status is not None else None
+        self.authenticated_account = self.account
+        self.authenticated_until = time.time() + float(self.expires)
 
+    def reset_session(self):
+        """Forgets the recorded session, so the next start relaunches
+        the app"""
+        self.session_id = None
+        self.authenticated_account = None
+        self.authenticated_until = 0
+
+    def is_authenticated(self, account: str) -> bool:
+        """Checks the Spotify app still runs the receiver session where
+        the account was added, and the token it received is still valid"""
+        status = self.castDevice.status
+
+        return (
+            self.is_launched
+            and self.session_id is not None
+            and status is not None
+            and status.app_id == APP_SPOTIFY
+            and status.session_id == self.session_id
+            and self.authenticated_account == account
+            and self.authenticated_until > time.time() + SESSION_EXPIRY_MARGIN
+        )
+
+    def _start_phase(self, phase: str):
+        self._phase_start[phase] = time.monotonic()
+
+    def _end_phase(self, phase: str):
+        start = self._phase_start.pop(phase, None)
+        if start is not None:
+            self.timings[phase] = time.monotonic() - start
+
+    def _launch_done(self):
+        """Records the launch timings and wakes up the callers waiting
+        for the launch. Called from the socket thread"""
+        self._end_phase("add_user")
+        self._end_phase("total")
+        self.logger.debug(
+            "Spotify launch on %s took %s",
+            self.castDevice.cast_info.friendly_name,
+            {phase: round(duration, 3) for phase, duration in self.timings.items()},
+        )
+
+        self.waiting.set()
+
+        if self._launched is not None:
+            self._loop.call_soon_threadsafe(self._set_launched)
+
+    def _set_launched(self):
+        if self._launched is not None and not self._launched.done():
+            self._launched.set_result(self.is_launched)
+
+    def _prepare_launch(self):
+        """Resets the launch state and provides the callback sending
+        getInfo once the app runs"""
         if self.access_token is None or self.expires is None:
             raise ValueError("access_token and expires cannot be empty")
 
+        if self.hass is None:
+            raise ValueError("hass cannot be empty")
+
         def callback(*_):
             """Callback function"""
+            self._end_phase("app_launch")
+            self._start_phase("get_info")
             self.send_message(
                 {
                     "type": TYPE_GET_INFO,
@@ -113,16 +249,52 @@ class SpotifyController(BaseController):
             )
 
         self.device = None
+        self.is_launched = False
         self.credential_error = False
         self.waiting.clear()
-        self.launch(callback_function=callback)
+        self.timings = {}
+        self._phase_start = {}
+        self._start_phase("total")
+        self._start_phase("app_launch")
 
-        counter = 0
-        while counter < (timeout + 1):
-            if self.is_launched:
-                return
-            self.waiting.wait(1)
-            counter += 1
+        return callback
+
+    async def async_launch_app(self, loop: asyncio.AbstractEventLoop, timeout=10):
+        """
+        Launch Spotify application and return as soon as the Spotify app
+        accepts or refuses the user.
+
+        Will raise a LaunchError exception if there is no response from the
+        Spotify app within timeout seconds. Cancelling the call stops
+        waiting for the response.
+        """
+        callback = self._prepare_launch()
+        self._loop = loop
+        self._launched = loop.create_future()
+
+        try:
+            await loop.run_in_executor(
+                None, partial(self.launch, callback_function=callback)
+            )
+            await asyncio.wait_for(self._launched, timeout)
+        except asyncio.TimeoutError as exc:
+            raise LaunchError(
+                "Timeout when waiting for status response from Spotify app"
+            ) from exc
+        finally:
+            self._launched = None
+
+    def launch_app(self, timeout=10):
+        """
+        Launch Spotify application.
+
+        Will raise a LaunchError exception if there is no response from the
+        Spotify app within timeout seconds.
+        """
+
+        callback = self._prepare_launch()
+        self.launch(callback_function=callback)
+        self.waiting.wait(timeout)
 
         if not self.is_launched:
             raise LaunchError(